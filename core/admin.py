@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models import Count, Prefetch
 from .models import (Unit, Facility, Sensor, Actuator, Rule, RuleSensor, Alert, Command, SensorActuator,
                      RuleCommand)
 
@@ -29,6 +30,7 @@ class SensorActuatorInlineForActuator(admin.TabularInline):
 class SensorAdmin(admin.ModelAdmin):
     list_display = ("name", "facility", "user", "unit", "sampling_s", "is_active", "created_at")
     list_filter = ("facility", "user", "unit", "is_active")
+    list_select_related = ("facility", "user", "unit")
     search_fields = ("name", "facility__name")
     inlines = [SensorActuatorInlineForSensor]
 
@@ -37,15 +39,25 @@ class ActuatorAdmin(admin.ModelAdmin):
     list_display = ("name", "facility", "type", "range_min", "range_max", "step", "is_active", "current_value",
                     "sensors_list")
     list_filter = ("type", "facility", "is_active")
+    list_select_related = ("facility",)
     search_fields = ("name", "facility__name", "sensors__name")
     inlines = [SensorActuatorInlineForActuator]
     autocomplete_fields = ("facility",)
 
+    def get_queryset(self, request):
+        # имена датчиков — одним запросом на страницу, число — в том же SELECT
+        return super().get_queryset(request).annotate(
+            sensors_count=Count("sensors", distinct=True),
+        ).prefetch_related(
+            Prefetch("sensors", queryset=Sensor.objects.only("id", "name"), to_attr="sensors_names"),
+        )
+
     def sensors_list(self, obj):
-        names = list(obj.sensors.values_list("name", flat=True)[:5])
-        more = obj.sensors.count() - len(names)
+        names = [s.name for s in obj.sensors_names[:5]]
+        more = obj.sensors_count - len(names)
         return ", ".join(names) + (f" (+{more})" if more > 0 else "")
     sensors_list.short_description = "Датчики"
+    sensors_list.admin_order_field = "sensors_count"
 
 
 class RuleSensorInline(admin.TabularInline):
@@ -60,6 +72,7 @@ class RuleCommandInline(admin.TabularInline):
 class RuleAdmin(admin.ModelAdmin):
     list_display = ("name", "user", "severity", "enabled", "window_s", "created_at")
     list_filter = ("enabled", "severity", "user")
+    list_select_related = ("user",)
     inlines = [RuleSensorInline, RuleCommandInline]
     search_fields = ("name", "expr")
 
@@ -67,9 +80,11 @@ class RuleAdmin(admin.ModelAdmin):
 class AlertAdmin(admin.ModelAdmin):
     list_display = ("rule", "started_at")
     list_filter = ["rule__severity"]
+    list_select_related = ("rule",)
     search_fields = ("message",)
 
 @admin.register(Command)
 class CommandAdmin(admin.ModelAdmin):
     list_display = ("actuator", "name", "created_by", "created_at", "commands_args", "status")
-    list_filter = ("status", "name", "actuator__type")
\ No newline at end of file
+    list_filter = ("status", "name", "actuator__type")
+    list_select_related = ("actuator__facility", "created_by")
\ No newline at end of file
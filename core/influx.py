@@ -1,20 +1,180 @@
 from django.conf import settings
-from influxdb_client import InfluxDBClient, Point, WritePrecision
+from django.core.cache import caches
+from core import metrics, tsdb
+from core.signals import readings_written
+from influxdb_client import Dialect, InfluxDBClient, WriteOptions
 from influxdb_client.client.write_api import SYNCHRONOUS
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from collections import Counter
+import atexit
+import logging
+import math
+import numpy as np
+import os
+import re
+import threading
 
-_client = InfluxDBClient(
-    url=settings.INFLUX_URL,
-    token=settings.INFLUX_TOKEN,
-    org=settings.INFLUX_ORG,
-    timeout=30_000,
-)
+log = logging.getLogger(__name__)
 
-_write = _client.write_api(write_options=SYNCHRONOUS)
-_query = _client.query_api()
+# Клиент и API создаются лениво, при первом обращении, и пересоздаются
+# в дочернем процессе после fork (потоки пакетной записи fork не переживают).
+_lock = threading.Lock()
+_pid = None
+_client = None
+_write_api = None   # пакетная запись: буфер + фоновый сброс
+_bulk_api = None    # синхронная запись: write_readings одним запросом
+_query_api = None
+
+def get_client() -> InfluxDBClient:
+    global _pid, _client, _write_api, _bulk_api, _query_api
+    if _client is not None and _pid == os.getpid():
+        return _client
+    with _lock:
+        if _client is None or _pid != os.getpid():
+            _client = InfluxDBClient(
+                url=settings.INFLUX_URL,
+                token=settings.INFLUX_TOKEN,
+                org=settings.INFLUX_ORG,
+                timeout=settings.INFLUX_TIMEOUT_MS,
+            )
+            _write_api = _bulk_api = _query_api = None
+            if _pid is None:
+                atexit.register(close)
+            _pid = os.getpid()
+    return _client
+
+def _write_options() -> WriteOptions:
+    return WriteOptions(
+        batch_size=settings.INFLUX_BATCH_SIZE,
+        flush_interval=settings.INFLUX_FLUSH_INTERVAL_MS,
+        retry_interval=settings.INFLUX_RETRY_INTERVAL_MS,
+        max_retries=settings.INFLUX_MAX_RETRIES,
+        max_retry_delay=settings.INFLUX_MAX_RETRY_DELAY_MS,
+        exponential_base=settings.INFLUX_EXPONENTIAL_BASE,
+    )
+
+def _on_write_error(conf, data, exception):
+    log.error("influx batch write failed (%s bytes): %s", len(data or b""), exception)
+
+def _on_write_retry(conf, data, exception):
+    log.warning("influx batch write retry: %s", exception)
+
+def _get_write_api():
+    global _write_api
+    client = get_client()
+    if _write_api is None:
+        with _lock:
+            if _write_api is None:
+                _write_api = client.write_api(
+                    write_options=_write_options(),
+                    error_callback=_on_write_error,
+                    retry_callback=_on_write_retry,
+                )
+    return _write_api
+
+def _get_bulk_api():
+    global _bulk_api
+    client = get_client()
+    if _bulk_api is None:
+        _bulk_api = client.write_api(write_options=SYNCHRONOUS)
+    return _bulk_api
+
+@metrics.timed("flux")
+def _query(flux: str):
+    """Выполнить Flux-запрос, вернуть таблицы."""
+    global _query_api
+    client = get_client()
+    if _query_api is None:
+        _query_api = client.query_api()
+    return _query_api.query(flux, org=settings.INFLUX_ORG)
+
+_CSV_DIALECT = Dialect(header=True, annotations=[], date_time_format="RFC3339Nano")
+
+@metrics.timed("flux")
+def _query_csv(flux: str) -> list[list[str]]:
+    """Выполнить Flux-запрос, вернуть строки CSV как есть (без FluxRecord на точку)."""
+    global _query_api
+    client = get_client()
+    if _query_api is None:
+        _query_api = client.query_api()
+    return list(_query_api.query_csv(flux, org=settings.INFLUX_ORG, dialect=_CSV_DIALECT))
+
+@metrics.timed("flux_write")
+def _write(lines, sync: bool = False):
+    """
+    Отправить line protocol: по умолчанию в пакетный буфер (уйдёт фоном
+    по batch size / flush interval), с sync=True — сразу одним запросом.
+    """
+    api = _get_bulk_api() if sync else _get_write_api()
+    api.write(bucket=settings.INFLUX_BUCKET, org=settings.INFLUX_ORG, record=lines)
+
+def _local():
+    """Встроенное хранилище core.tsdb, если TSDB_BACKEND = "local", иначе None."""
+    if settings.TSDB_BACKEND != "local":
+        return None
+    return tsdb.store()
+
+def flush():
+    """Дописать всё, что лежит в пакетном буфере (блокирует до отправки)."""
+    global _write_api
+    db = _local()
+    if db is not None:
+        db.flush()
+    with _lock:
+        api, _write_api = _write_api, None
+    if api is not None and _pid == os.getpid():
+        api.close()
+
+def close():
+    """Сбросить буфер и закрыть клиента; вызывается и при выходе процесса."""
+    global _client, _bulk_api, _query_api
+    flush()
+    with _lock:
+        client, _client = _client, None
+        _bulk_api = _query_api = None
+    if client is not None and _pid == os.getpid():
+        client.close()
 
 MEASUREMENT = "readings"
 
+_RANGE_RE = re.compile(r"^(\d+)([smhdw])$")
+_RANGE_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
+def parse_range(rng: str) -> timedelta:
+    """
+    Разобрать длительность вида "30m", "24h", "7d" в timedelta.
+    Бросает ValueError на всё остальное (строка идёт прямо во Flux).
+    """
+    m = _RANGE_RE.match(rng or "")
+    if not m:
+        raise ValueError(f"bad range: {rng!r}")
+    return timedelta(**{_RANGE_UNITS[m.group(2)]: int(m.group(1))})
+
+AGGREGATES = ("mean", "min", "max", "last")
+
+def window_every(rng: str, points: int) -> int:
+    """
+    Ширина окна агрегации (мс), чтобы диапазон rng уложился в points точек.
+    Агрегируем всегда, даже окнами в 1 мс: приём (api/ingest) пишет точки
+    чаще раза в секунду, и без окна ответ не ограничен по длине.
+    """
+    if points <= 0:
+        raise ValueError(f"bad points: {points!r}")
+    # окна выровнены по эпохе, и диапазон задевает на окно больше, чем
+    # range / every: берём every чуть шире range / points
+    return parse_range(rng) // timedelta(milliseconds=1) // points + 1
+
+def _ts_ns(ts) -> int:
+    """datetime (наивное = UTC) или целые наносекунды -> наносекунды."""
+    if isinstance(ts, datetime):
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return (int(ts.timestamp()) * 1_000_000_000) + ts.microsecond * 1_000
+    return int(ts)
+
+def _line(sensor_id: int, ts, value: float) -> str:
+    return f"{MEASUREMENT},sensor_id={int(sensor_id)} value={float(value)!r} {_ts_ns(ts)}"
+
 def write_reading(sensor_id: int, ts: datetime, value: float):
     """
     Записать одно измерение:
@@ -22,60 +182,355 @@ def write_reading(sensor_id: int, ts: datetime, value: float):
     - tag: sensor_id
     - field: value (float)
     - time: ts (UTC)
+    Точка уходит в пакетный буфер, а не отдельным HTTP-запросом.
+    Нечисловое значение (None/NaN/inf) не пишется: InfluxDB отверг бы
+    строку, а с ней и всю пачку.
     """
-    if ts.tzinfo is None:
-        ts = ts.replace(tzinfo=timezone.utc)
+    if value is None or not math.isfinite(value):
+        return
+    db = _local()
+    if db is not None:
+        with metrics.timed("flux_write"):
+            db.append([int(sensor_id)], [_ts_ns(ts)], [float(value)])
+    else:
+        _write(_line(sensor_id, ts, value))
+    _written([(sensor_id, ts, value)])
 
-    p = (
-        Point(MEASUREMENT)
-        .tag("sensor_id", str(sensor_id))
-        .field("value", float(value))
-        .time(ts, WritePrecision.NS)
-    )
-    _write.write(bucket=settings.INFLUX_BUCKET, org=settings.INFLUX_ORG, record=p)
+def write_readings(readings, sync: bool = True) -> int:
+    """
+    Записать пачку измерений [(sensor_id, ts, value), ...] одним запросом
+    line protocol (sync=False — через пакетный буфер). ts — datetime или нс.
+    Нечисловые значения (NaN/inf) пропускаются. Вернёт число записанных точек.
+    """
+    readings = [r for r in readings if r[2] is not None and math.isfinite(r[2])]
+    if readings:
+        db = _local()
+        if db is not None:
+            with metrics.timed("flux_write"):
+                db.append([r[0] for r in readings], [_ts_ns(r[1]) for r in readings],
+                          [float(r[2]) for r in readings], sync=sync)
+        else:
+            _write([_line(*r) for r in readings], sync=sync)
+        _written(readings)
+    return len(readings)
 
-def latest_reading(sensor_id: int):
+def write_series(sensor_id: int, ts_ns, values) -> int:
     """
-    Вернёт последнее значение по времени для данного сенсора:
-    (timestamp: datetime, value: float) или None.
-    Схлопывает все группы (все теги) и берёт глобально последнее.
+    Записать ряд одного сенсора из массивов (метки в нс, значения) одним
+    запросом — для массовой загрузки истории. NaN/inf пропускаются.
+    В кэш последних значений идёт только последняя точка, сигнал
+    readings_written не отправляется: по истории правила не вычисляются.
     """
+    ts_ns = np.asarray(ts_ns, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    ok = np.isfinite(values)
+    if not ok.all():
+        ts_ns, values = ts_ns[ok], values[ok]
+    if not len(values):
+        return 0
+    db = _local()
+    if db is not None:
+        with metrics.timed("flux_write"):
+            db.append(np.full(len(values), int(sensor_id), dtype=np.int64), ts_ns, values, sync=True)
+    else:
+        prefix = f"{MEASUREMENT},sensor_id={int(sensor_id)} value="
+        _write([f"{prefix}{v!r} {t}" for t, v in zip(ts_ns.tolist(), values.tolist())], sync=True)
+    _remember_latest([(int(sensor_id), _ts_datetime(int(ts_ns[-1])), float(values[-1]))])
+    return len(values)
+
+# ===== Кэш последних значений =====
+# Пишущие пути обновляют кэш на каждой записи, чтение идёт во Flux только
+# при промахе. Бэкенд — алиас LATEST_CACHE в CACHES: LocMemCache (LRU + TTL
+# в памяти процесса) или RedisCache, общий для всех процессов.
+LATEST_CACHE = "latest"
+
+def _latest_cache():
+    return caches[LATEST_CACHE]
+
+def _latest_key(sensor_id: int) -> str:
+    return f"latest:{int(sensor_id)}"
+
+# значение в кэше для сенсора, у которого точек за 30 дней не нашлось:
+# до LATEST_CACHE_FILL_TIMEOUT его не ищем заново (лестница окон — до 10 запросов)
+NO_DATA = None
+
+def _ts_datetime(ts) -> datetime:
+    if isinstance(ts, datetime):
+        return ts if ts.tzinfo is not None else ts.replace(tzinfo=timezone.utc)
+    return datetime.fromtimestamp(int(ts) / 1e9, tz=timezone.utc)
+
+def _written(readings):
+    """Общий хвост записи: кэш последних значений и сигнал readings_written."""
+    stamps = {}   # в пачке обычно одна-две метки времени на все точки
+    readings = [
+        (int(sid), stamps[ts] if ts in stamps else stamps.setdefault(ts, _ts_datetime(ts)), float(value))
+        for sid, ts, value in readings
+    ]
+    _remember_latest(readings)
+    readings_written.send(sender=__name__, readings=readings)
+
+def _remember_latest(readings):
+    """Положить в кэш самые свежие из [(sensor_id, ts, value), ...], не затирая более новые."""
+    newest: dict[str, tuple[datetime, float]] = {}
+    for sensor_id, ts, value in readings:
+        key = _latest_key(sensor_id)
+        if key not in newest or ts >= newest[key][0]:
+            newest[key] = (ts, value)
+    cache = _latest_cache()
+    cached = cache.get_many(list(newest))
+    fresh = {k: v for k, v in newest.items()
+             if k not in cached or cached[k] is NO_DATA or v[0] >= cached[k][0]}
+    if fresh:
+        cache.set_many(fresh)
+
+# Последнюю точку ищем сначала в коротком окне из нескольких периодов
+# опроса сенсора (sampling_s) и расширяем окно по лестнице, только если
+# там пусто. Ступени общие для всех сенсоров, так что за один проход
+# лестницы выходит не больше запроса на ступень.
+LATEST_MAX_WINDOW_S = 30 * 24 * 3600
+
+def _latest_windows() -> tuple[int, ...]:
+    windows, w = [], settings.LATEST_MIN_WINDOW_S
+    while w < LATEST_MAX_WINDOW_S:
+        windows.append(w)
+        w *= settings.LATEST_WINDOW_GROWTH
+    windows.append(LATEST_MAX_WINDOW_S)
+    return tuple(windows)
+
+# на какой ступени нашлась последняя точка ("none" — не нашлась вовсе)
+_latest_window_hits: Counter = Counter()
+
+def latest_window_stats() -> dict:
+    """Сколько раз последняя точка нашлась в окне каждой ширины, с."""
+    return dict(_latest_window_hits)
+
+def _first_window(windows, sampling_s: int | None) -> int:
+    need = settings.LATEST_WINDOW_PERIODS * (sampling_s or settings.LATEST_DEFAULT_SAMPLING_S)
+    return next((i for i, w in enumerate(windows) if w >= need), len(windows) - 1)
+
+def _query_latest(sensor_ids, window_s: int) -> dict[int, tuple[datetime, float]]:
+    """Последние точки набора сенсоров одним Flux-запросом: last() в группе сенсора."""
+    id_set = ", ".join(f'"{int(i)}"' for i in sensor_ids)
     flux = f'''
 from(bucket: "{settings.INFLUX_BUCKET}")
-  |> range(start: -30d)
+  |> range(start: -{int(window_s)}s)
   |> filter(fn: (r) => r["_measurement"] == "{MEASUREMENT}")
-  |> filter(fn: (r) => r["sensor_id"] == "{sensor_id}")
+  |> filter(fn: (r) => contains(value: r["sensor_id"], set: [{id_set}]))
   |> filter(fn: (r) => r["_field"] == "value")
-  |> group(columns: [])            // убрать все группировки, чтобы last() был глобальным
+  |> group(columns: ["sensor_id"])  // схлопнуть прочие теги, last() — по сенсору
   |> last()
-  |> keep(columns: ["_time","_value"])
+  |> keep(columns: ["_time","_value","sensor_id"])
 '''
-    tables = _query.query(flux, org=settings.INFLUX_ORG)
+    tables = _query(flux)
 
-    latest = None
+    latest: dict[int, tuple[datetime, float]] = {}
     for table in tables:
         for rec in table.records:
-            ts = rec.get_time()
             val = rec.get_value()
-            if latest is None or ts > latest[0]:
-                latest = (ts, float(val) if val is not None else None)
+            if val is None:
+                continue
+            sid = int(rec.values["sensor_id"])
+            ts = rec.get_time()
+            if sid not in latest or ts > latest[sid][0]:
+                latest[sid] = (ts, float(val))
+    return latest
+
+def _query_latest_adaptive(sensor_ids, sampling_s: dict[int, int]) -> dict[int, tuple[datetime, float]]:
+    windows = _latest_windows()
+    step = {i: _first_window(windows, sampling_s.get(i)) for i in sensor_ids}
+    latest: dict[int, tuple[datetime, float]] = {}
+    while step:
+        rung = min(step.values())
+        ids = [i for i, r in step.items() if r == rung]
+        found = _query_latest(ids, windows[rung])
+        latest.update(found)
+        _latest_window_hits[windows[rung]] += len(found)
+        for i in ids:
+            if i in found or rung == len(windows) - 1:
+                del step[i]
+            else:
+                step[i] = rung + 1
+    _latest_window_hits["none"] += len(set(sensor_ids) - latest.keys())
+    return latest
+
+def latest_readings(sensor_ids, sampling_s: dict[int, int] | None = None) -> dict[int, tuple[datetime, float]]:
+    """
+    Последние значения сразу для набора сенсоров: {sensor_id: (timestamp, value)}.
+    Всё, что есть в кэше последних значений, берётся оттуда; промахи — Flux-
+    запросом в окне из нескольких периодов sampling_s ({sensor_id: с}),
+    которое расширяется, пока точка не найдётся (до 30 дней). Результат
+    кладётся в кэш на LATEST_CACHE_FILL_TIMEOUT (другой процесс мог писать
+    мимо нашего кэша, долго держать нельзя), как и отметка NO_DATA для
+    сенсоров без данных за 30 дней — в ответ они не попадают.
+    """
+    ids = sorted({int(i) for i in sensor_ids})
+    if not ids:
+        return {}
+    cache = _latest_cache()
+    cached = cache.get_many([_latest_key(i) for i in ids])
+    latest = {i: cached[_latest_key(i)] for i in ids
+              if _latest_key(i) in cached and cached[_latest_key(i)] is not NO_DATA}
 
+    missing = [i for i in ids if _latest_key(i) not in cached]
+    if missing:
+        db = _local()
+        if db is not None:
+            start_ns = _ts_ns(datetime.now(timezone.utc)) - LATEST_MAX_WINDOW_S * 1_000_000_000
+            with metrics.timed("flux"):
+                found = {sid: (_ts_datetime(t), v) for sid, (t, v) in db.latest(missing, start_ns).items()}
+        else:
+            found = _query_latest_adaptive(missing, sampling_s or {})
+        for sid in missing:
+            cache.add(_latest_key(sid), found.get(sid, NO_DATA), timeout=settings.LATEST_CACHE_FILL_TIMEOUT)
+        latest.update(found)
     return latest
 
+def latest_reading(sensor_id: int, sampling_s: int | None = None):
+    """
+    Вернёт последнее значение по времени для данного сенсора:
+    (timestamp: datetime, value: float) или None. См. latest_readings.
+    """
+    sensor_id = int(sensor_id)
+    return latest_readings([sensor_id], {sensor_id: sampling_s}).get(sensor_id)
+
 def latest_value(sensor_id: int) -> float | None:
-    flux = f'''
+    latest = latest_reading(sensor_id)
+    return latest[1] if latest is not None else None
+
+def _series_starts(ids, rng: str, since_ms) -> tuple[datetime, int, dict[int, int]]:
+    """
+    (сейчас, начало окна rng в мс, {sensor_id: начало ряда в мс}).
+    since_ms — курсор: одна метка на все сенсоры или {sensor_id: мс}; ряд
+    начинается сразу после него, но не раньше окна.
+    """
+    now = datetime.now(timezone.utc)
+    window_start = int((now - parse_range(rng)).timestamp() * 1000)
+    if not isinstance(since_ms, dict):
+        since_ms = dict.fromkeys(ids, since_ms)
+    starts = {}
+    for sid in ids:
+        since = since_ms.get(sid)
+        starts[sid] = window_start if since is None else max(int(since) + 1, window_start)
+    return now, window_start, starts
+
+def _flux_time(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+def _series_flux(ids, rng: str, since_ms, every_ms: int | None, fn: str) -> str:
+    if fn not in AGGREGATES:
+        raise ValueError(f"bad aggregate: {fn!r}")
+    _, window_start, starts = _series_starts(ids, rng, since_ms)
+
+    # общее начало — самый ранний курсор; у кого курсор позже, тем своё
+    # условие на _time
+    lo = min(starts.values(), default=window_start)
+    start = f"-{rng}" if lo == window_start else f"time(v: {lo * 1_000_000})"
+    plain = [i for i in ids if starts[i] == lo]
+    id_set = ", ".join(f'"{i}"' for i in plain)
+    conds = [f'contains(value: r["sensor_id"], set: [{id_set}])'] if plain else []
+    conds += [f'(r["sensor_id"] == "{i}" and r["_time"] >= {_flux_time(starts[i])})'
+              for i in ids if starts[i] != lo]
+
+    if every_ms:
+        shape = f'''
+  |> aggregateWindow(every: {int(every_ms)}ms, fn: {fn}, createEmpty: false, timeSrc: "_start")
+  |> keep(columns: ["_time","_value","sensor_id"])'''
+    else:
+        shape = '''
+  |> keep(columns: ["_time","_value","sensor_id"])
+  |> sort(columns: ["_time"])'''
+
+    return f'''
 from(bucket: "{settings.INFLUX_BUCKET}")
-  |> range(start: -30d)
+  |> range(start: {start})
   |> filter(fn: (r) => r["_measurement"] == "{MEASUREMENT}")
-  |> filter(fn: (r) => r["sensor_id"] == "{sensor_id}")
+  |> filter(fn: (r) => {" or ".join(conds) or "false"})
   |> filter(fn: (r) => r["_field"] == "value")
-  |> group(columns: [])
-  |> last()
-  |> keep(columns: ["_value"])
+  |> group(columns: ["sensor_id"])  // по таблице на сенсор{shape}
 '''
-    tables = _query.query(flux, org=settings.INFLUX_ORG)
+
+@metrics.timed("flux")
+def _local_series(db, ids, rng: str, since_ms,
+                  every_ms: int | None, fn: str) -> dict[int, tuple[np.ndarray, np.ndarray]]:
+    """read_series_arrays по core.tsdb: те же окно, курсоры и прореживание, что во Flux."""
+    if fn not in AGGREGATES:
+        raise ValueError(f"bad aggregate: {fn!r}")
+    now, _, starts = _series_starts(ids, rng, since_ms)
+    end_ns = _ts_ns(now)
+    series = {}
+    for sid in ids:
+        found = db.series([sid], starts[sid] * 1_000_000, end_ns).get(sid)
+        if found is None:
+            continue
+        ts, values = found
+        if every_ms:
+            ts, values = tsdb.aggregate(ts, values, int(every_ms) * 1_000_000, fn)
+        series[sid] = (ts // 1_000_000, values)
+    return series
+
+def read_series(sensor_ids, rng: str = "24h", since_ms: int | dict[int, int] | None = None,
+                every_ms: int | None = None, fn: str = "mean") -> dict[int, list[tuple[int, float]]]:
+    """
+    Ряды показаний сразу для нескольких сенсоров одним Flux-запросом:
+    {sensor_id: [(ts_ms, value), ...]}, точки по возрастанию времени.
+    Сенсоры без точек в диапазоне в ответ не попадают.
+
+    since_ms — курсор инкрементального опроса: вернуть только точки строго
+    новее этой метки (но не старше окна rng); одна метка на все сенсоры или
+    {sensor_id: мс} — у каждого сенсора свой курсор.
+    every_ms — прорядить на сервере: aggregateWindow с функцией fn, по точке
+    на окно, время точки = начало окна.
+    """
+    ids = sorted({int(i) for i in sensor_ids})
+    db = _local()
+    if db is not None:
+        return {sid: list(zip(ts.tolist(), values.tolist()))
+                for sid, (ts, values) in _local_series(db, ids, rng, since_ms, every_ms, fn).items()}
+    flux = _series_flux(ids, rng, since_ms, every_ms, fn)
+    if not ids:
+        return {}
+    tables = _query(flux)
+
+    series: dict[int, list[tuple[int, float]]] = {}
     for table in tables:
         for rec in table.records:
-            val = rec.get_value()
-            return float(val) if val is not None else None
-    return None
\ No newline at end of file
+            sid = int(rec.values["sensor_id"])
+            ts_ms = int(rec.get_time().timestamp() * 1000)
+            series.setdefault(sid, []).append((ts_ms, rec.get_value()))
+    return series
+
+def read_series_arrays(sensor_ids, rng: str = "24h", since_ms: int | dict[int, int] | None = None,
+                       every_ms: int | None = None, fn: str = "mean") -> dict[int, tuple[np.ndarray, np.ndarray]]:
+    """
+    То же, что read_series, но {sensor_id: (ts_ms: int64[], value: float64[])}:
+    ответ Flux читается как CSV и разбирается в массивы NumPy целиком,
+    без объекта на точку — для больших диапазонов и компактных форматов.
+    """
+    ids = sorted({int(i) for i in sensor_ids})
+    db = _local()
+    if db is not None:
+        return _local_series(db, ids, rng, since_ms, every_ms, fn)
+    flux = _series_flux(ids, rng, since_ms, every_ms, fn)
+    if not ids:
+        return {}
+
+    rows = _query_csv(flux)
+    header = next((r for r in rows if "_time" in r), None)
+    if header is None:
+        return {}
+    it, iv, isid = header.index("_time"), header.index("_value"), header.index("sensor_id")
+    rows = [r for r in rows if len(r) == len(header) and r[it] and r[it] != "_time"]
+    if not rows:
+        return {}
+
+    n = len(rows)
+    # RFC3339Nano в UTC: без "Z" на конце NumPy разбирает его сам
+    ts_ms = np.array([r[it][:-1] for r in rows], dtype="datetime64[ms]").astype(np.int64)
+    values = np.fromiter((r[iv] for r in rows), dtype=float, count=n)
+    sids = np.fromiter((r[isid] for r in rows), dtype=np.int64, count=n)
+
+    order = np.lexsort((ts_ms, sids))
+    ts_ms, values, sids = ts_ms[order], values[order], sids[order]
+    uniq, starts = np.unique(sids, return_index=True)
+    bounds = np.append(starts, len(sids))
+    return {int(sid): (ts_ms[a:b], values[a:b]) for sid, a, b in zip(uniq, bounds[:-1], bounds[1:])}
@@ -0,0 +1,144 @@
+"""
+Приём показаний от устройств (portal: POST api/ingest/).
+
+Тело — JSON-массив [{"id": <sensor_id>, "t": <мс, необязательно>, "v": <значение>}, ...]
+или line protocol InfluxDB (readings,sensor_id=<id> value=<значение> [<время>]).
+Каждое показание проверяется по таблице датчиков в памяти процесса
+(активен ли датчик, попадает ли значение в min_val/max_val), так что на
+показание нет запросов к БД; таблица перечитывается раз в INGEST_SENSORS_TTL_S
+и сразу после правки датчика в этом процессе (core.signals).
+Принятое уходит в пакетный писатель core.influx.
+"""
+import json
+import math
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from core import influx
+
+PRECISIONS = {"ns": 1, "us": 1_000, "ms": 1_000_000, "s": 1_000_000_000}
+
+# время должно лечь в int64-наносекунды (до 2262 года): иначе в JSON, скорее
+# всего, микросекунды или наносекунды вместо мс
+MAX_T_NS = 2 ** 63 - 1
+
+class IngestError(ValueError):
+    """Тело запроса не разобралось целиком."""
+
+class SensorTable:
+    """{sensor_id: (min_val, max_val)} активных датчиков, с TTL."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sensors: dict[int, tuple] | None = None
+        self._loaded_at = 0.0
+
+    def get(self) -> dict[int, tuple]:
+        with self._lock:
+            expired = time.monotonic() - self._loaded_at > settings.INGEST_SENSORS_TTL_S
+            if self._sensors is None or expired:
+                from core.models import Sensor
+
+                rows = Sensor.objects.filter(is_active=True).values_list("id", "min_val", "max_val")
+                self._sensors = {sid: (lo, hi) for sid, lo, hi in rows}
+                self._loaded_at = time.monotonic()
+            return self._sensors
+
+    def invalidate(self):
+        with self._lock:
+            self._sensors = None
+
+sensors = SensorTable()
+
+def parse_json(body: bytes) -> list[tuple]:
+    """JSON-массив показаний -> [(sensor_id, t, value), ...]; t — мс или None."""
+    try:
+        items = json.loads(body)
+    except ValueError as e:
+        raise IngestError(f"не JSON: {e}") from None
+    if not isinstance(items, list):
+        raise IngestError("ожидался JSON-массив показаний")
+    readings = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise IngestError("показание — объект {\"id\", \"t\", \"v\"}")
+        readings.append((item.get("id"), item.get("t"), item.get("v")))
+    return readings
+
+_LINE_RE = re.compile(
+    rf"^{influx.MEASUREMENT},sensor_id=(?P<id>\d+) value=(?P<v>\S+?)i?(?: (?P<t>-?\d+))?$"
+)
+
+def parse_line_protocol(text: str, precision: str = "ns") -> list[tuple]:
+    """
+    Line protocol -> [(sensor_id, t, value), ...], t — нс или None:
+    точки ближе миллисекунды не сливаются (ingest(..., t_scale=1)).
+    Понимается только наш формат: measurement readings, тег sensor_id,
+    поле value; пустые строки и комментарии (#) пропускаются.
+    """
+    if precision not in PRECISIONS:
+        raise IngestError(f"precision: одно из {', '.join(PRECISIONS)}")
+    scale = PRECISIONS[precision]
+    readings = []
+    for n, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        m = _LINE_RE.match(line)
+        if m is None:
+            raise IngestError(f"строка {n}: ожидалось '{influx.MEASUREMENT},sensor_id=<id> value=<число> [<время>]'")
+        try:
+            value = float(m["v"])
+        except ValueError:
+            raise IngestError(f"строка {n}: value не число") from None
+        t = int(m["t"]) * scale if m["t"] else None
+        readings.append((int(m["id"]), t, value))
+    return readings
+
+def _check(sensor_id, t, value, table, t_scale=1_000_000) -> tuple[tuple | None, str | None]:
+    """(sensor_id, ts_ns, value) или причина отказа; t_scale — нс в единице t."""
+    if isinstance(sensor_id, bool) or not isinstance(sensor_id, int):
+        return None, "id — целое"
+    bounds = table.get(sensor_id)
+    if bounds is None:
+        return None, "нет такого активного датчика"
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None, "v — конечное число"
+    try:
+        fv = float(value)   # целое из JSON может не влезть во float
+    except OverflowError:
+        return None, "v — конечное число"
+    if not math.isfinite(fv):
+        return None, "v — конечное число"
+    lo, hi = bounds
+    if (lo is not None and fv < lo) or (hi is not None and fv > hi):
+        return None, f"v вне [{lo}, {hi}]"
+    if t is not None and (isinstance(t, bool) or not isinstance(t, int)):
+        return None, "t — целое"
+    if t is not None and not 0 <= t * t_scale <= MAX_T_NS:
+        return None, f"t вне [0, {MAX_T_NS // t_scale}]"
+    return (sensor_id, t * t_scale if t is not None else None, fv), None
+
+def ingest(readings: list[tuple], t_scale: int = 1_000_000) -> tuple[int, list[dict]]:
+    """
+    Проверить показания [(sensor_id, t | None, value), ...] и отдать
+    годные в пакетный писатель (без t — текущее время). t — в мс, как
+    из parse_json; для parse_line_protocol (нс) t_scale=1.
+    Вернёт (принято, [{"index", "error"}, ...] по отклонённым).
+    """
+    table = sensors.get()
+    now_ns = influx._ts_ns(timezone.now())
+    accepted, rejected = [], []
+    for i, (sensor_id, t, value) in enumerate(readings):
+        reading, error = _check(sensor_id, t, value, table, t_scale)
+        if error:
+            rejected.append({"index": i, "error": error})
+        else:
+            accepted.append(reading if reading[1] is not None else (reading[0], now_ns, reading[2]))
+    if accepted:
+        influx.write_readings(accepted, sync=False)
+    return len(accepted), rejected
@@ -0,0 +1,148 @@
+"""
+Живые обновления для браузеров: Server-Sent Events (portal: api/live/),
+работают только под ASGI (dacha.asgi).
+
+Один хаб на процесс раздаёт события всем подписчикам:
+- "readings" {"<id>": {"t": <мс>, "v": <значение>}} — новые последние значения;
+- "alert" {"id", "rule", "severity", "t", "message"} — новые Alert.
+Показания, записанные в этом же процессе (api/ingest), приходят сразу по
+сигналу readings_written. Всё, что пишут другие процессы (симулятор),
+подхватывает один общий опросчик: раз в LIVE_POLL_S один latest_readings по
+активным датчикам и один запрос новых Alert — сколько бы вкладок ни было
+открыто. Пока подписчиков нет, опросчик не работает.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from core import influx
+
+log = logging.getLogger(__name__)
+
+def _ms(ts) -> int:
+    return int(ts.timestamp() * 1000)
+
+class Hub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: set[tuple] = set()   # (loop, asyncio.Queue)
+        self._poller: asyncio.Task | None = None
+        self._latest: dict[str, dict] = {}       # уже разосланное: "<id>" -> {"t", "v"}
+        self._last_alert_id: int | None = None
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    # ----- подписка -----
+    def subscribe(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=settings.LIVE_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add((loop, queue))
+            if self._poller is None or self._poller.done():
+                self._poller = loop.create_task(self._poll_forever())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            self._subscribers = {sub for sub in self._subscribers if sub[1] is not queue}
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return dict(self._latest)
+
+    # ----- рассылка -----
+    @staticmethod
+    def _put(queue: asyncio.Queue, item):
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            pass   # медленный клиент: следующее "readings" всё равно принесёт свежие значения
+
+    def publish(self, event: str, data):
+        """Разослать событие всем подписчикам; можно звать из любого потока."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._put, queue, (event, data))
+
+    def publish_readings(self, readings):
+        """[(sensor_id, ts: datetime, value), ...] -> "readings" с тем, что новее разосланного."""
+        if not self._subscribers:
+            return
+        changed = {}
+        with self._lock:
+            for sensor_id, ts, value in readings:
+                key, rec = str(sensor_id), {"t": _ms(ts), "v": value}
+                prev = self._latest.get(key)
+                if prev is None or rec["t"] > prev["t"]:
+                    self._latest[key] = changed[key] = rec
+        if changed:
+            self.publish("readings", changed)
+
+    # ----- общий опросчик -----
+    def _poll(self):
+        from core.models import Alert, Sensor
+
+        sampling = dict(Sensor.objects.filter(is_active=True).values_list("id", "sampling_s"))
+        latest = influx.latest_readings(sampling, sampling_s=sampling)
+        self.publish_readings((sid, ts, v) for sid, (ts, v) in latest.items())
+
+        alerts = Alert.objects.select_related("rule").order_by("id")
+        if self._last_alert_id is None:
+            self._last_alert_id = alerts.values_list("id", flat=True).last() or 0
+            return
+        for a in alerts.filter(id__gt=self._last_alert_id):
+            self._last_alert_id = a.id
+            self.publish("alert", {
+                "id": a.id, "rule": a.rule.name, "severity": a.rule.severity,
+                "t": _ms(a.started_at), "message": a.message,
+            })
+
+    async def _poll_forever(self):
+        while self._subscribers:
+            try:
+                await sync_to_async(self._poll)()
+            except Exception:
+                log.exception("live poll failed")
+            await asyncio.sleep(settings.LIVE_POLL_S)
+
+hub = Hub()
+
+def _event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream(sensor_ids=None):
+    """
+    Поток SSE для одного клиента: сначала всё уже известное, дальше события
+    хаба; sensor_ids — показывать только эти датчики. Раз в LIVE_HEARTBEAT_S
+    без событий уходит комментарий, чтобы прокси не рвали соединение.
+    """
+    ids = {str(i) for i in sensor_ids} if sensor_ids else None
+
+    def only(data):
+        return {k: v for k, v in data.items() if k in ids} if ids else data
+
+    queue = hub.subscribe()
+    try:
+        yield f"retry: {settings.LIVE_POLL_S * 1000}\n\n"
+        snapshot = only(hub.snapshot())
+        if snapshot:
+            yield _event("readings", snapshot)
+        while True:
+            try:
+                event, data = await asyncio.wait_for(queue.get(), timeout=settings.LIVE_HEARTBEAT_S)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if event == "readings":
+                data = only(data)
+                if not data:
+                    continue
+            yield _event(event, data)
+    finally:
+        hub.unsubscribe(queue)
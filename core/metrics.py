@@ -0,0 +1,185 @@
+"""
+Учёт времени запросов (core.middleware.RequestMetricsMiddleware).
+
+На каждый HTTP-запрос заводится RequestStats в contextvar, и всё, что
+запрос делает, дописывает туда число и время:
+- "db" — SQL, через execute_wrapper на каждом соединении (core.signals);
+- "flux" / "flux_write" — чтение и запись показаний (core.influx: _query,
+  _query_csv, _write; при TSDB_BACKEND = "local" — то же для core.tsdb);
+- "serialize" — сборка ответа: отрисовка шаблона TemplateResponse и
+  JSON/бинарные ряды в portal.views.
+Вне запроса (симулятор, команды) учёт ничего не стоит: статистики нет.
+
+Итог запроса агрегируется по имени view в памяти процесса и отдаётся в
+текстовом формате Prometheus (core.views.metrics). У каждого процесса
+сервера свои счётчики — Prometheus собирает их с каждого.
+"""
+import contextvars
+import threading
+import time
+from contextlib import ContextDecorator
+
+KINDS = ("db", "flux", "flux_write", "serialize")
+
+class RequestStats:
+    __slots__ = ("started", "count", "seconds")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = dict.fromkeys(KINDS, 0)
+        self.seconds = dict.fromkeys(KINDS, 0.0)
+
+    def add(self, kind: str, seconds: float):
+        self.count[kind] += 1
+        self.seconds[kind] += seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+_current: contextvars.ContextVar[RequestStats | None] = contextvars.ContextVar("request_stats", default=None)
+
+def start() -> tuple[RequestStats, contextvars.Token]:
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+def stop(token: contextvars.Token):
+    _current.reset(token)
+
+def current() -> RequestStats | None:
+    return _current.get()
+
+class timed(ContextDecorator):
+    """Засчитать блок (или вызов функции) текущему запросу как kind."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+
+    def __enter__(self):
+        self._stats = _current.get()
+        if self._stats is not None:
+            self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self._stats is not None:
+            self._stats.add(self.kind, time.perf_counter() - self._t0)
+        return False
+
+    def _recreate_cm(self):
+        # декоратор: свой экземпляр на вызов, иначе параллельные вызовы делят _t0
+        return timed(self.kind)
+
+def db_wrapper(execute, sql, params, many, context):
+    """execute_wrapper для соединений БД: время каждого SQL — в "db"."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    t0 = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add("db", time.perf_counter() - t0)
+
+def instrument_connection(connection):
+    if db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_wrapper)
+
+# ===== Агрегаты по view =====
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "n")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.n = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.n += 1
+
+    def lines(self, name: str, labels: str) -> list[str]:
+        out, total = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            out.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+        out.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.n}')
+        out.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        out.append(f"{name}_count{{{labels}}} {self.n}")
+        return out
+
+class ViewMetrics:
+    __slots__ = ("duration", "db_queries", "count", "seconds", "responses")
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.db_queries = Histogram(QUERY_BUCKETS)
+        self.count = dict.fromkeys(KINDS, 0)
+        self.seconds = dict.fromkeys(KINDS, 0.0)
+        self.responses: dict[str, int] = {}   # "2xx" -> число
+
+_lock = threading.Lock()
+_views: dict[str, ViewMetrics] = {}
+
+def record(view: str, status: int, stats: RequestStats, total_s: float):
+    with _lock:
+        m = _views.get(view)
+        if m is None:
+            m = _views[view] = ViewMetrics()
+        m.duration.observe(total_s)
+        m.db_queries.observe(stats.count["db"])
+        for kind in KINDS:
+            m.count[kind] += stats.count[kind]
+            m.seconds[kind] += stats.seconds[kind]
+        code = f"{status // 100}xx"
+        m.responses[code] = m.responses.get(code, 0) + 1
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def prometheus() -> str:
+    """Все агрегаты в текстовом формате Prometheus 0.0.4."""
+    with _lock:
+        views = sorted(_views.items())
+        out = [
+            "# HELP dacha_request_duration_seconds Время обработки запроса.",
+            "# TYPE dacha_request_duration_seconds histogram",
+        ]
+        for view, m in views:
+            out += m.duration.lines("dacha_request_duration_seconds", f'view="{_label(view)}"')
+        out += [
+            "# HELP dacha_request_db_queries SQL-запросов за HTTP-запрос.",
+            "# TYPE dacha_request_db_queries histogram",
+        ]
+        for view, m in views:
+            out += m.db_queries.lines("dacha_request_db_queries", f'view="{_label(view)}"')
+        out += [
+            "# HELP dacha_requests_total Ответы по классу статуса.",
+            "# TYPE dacha_requests_total counter",
+        ]
+        for view, m in views:
+            for code, n in sorted(m.responses.items()):
+                out.append(f'dacha_requests_total{{view="{_label(view)}",code="{code}"}} {n}')
+        for kind in KINDS:
+            out += [
+                f"# HELP dacha_{kind}_calls_total Вызовов {kind} в запросах.",
+                f"# TYPE dacha_{kind}_calls_total counter",
+            ]
+            out += [f'dacha_{kind}_calls_total{{view="{_label(v)}"}} {m.count[kind]}' for v, m in views]
+            out += [
+                f"# HELP dacha_{kind}_seconds_total Время {kind} в запросах.",
+                f"# TYPE dacha_{kind}_seconds_total counter",
+            ]
+            out += [f'dacha_{kind}_seconds_total{{view="{_label(v)}"}} {m.seconds[kind]:.6f}' for v, m in views]
+    return "\n".join(out) + "\n"
+
+def reset():
+    with _lock:
+        _views.clear()
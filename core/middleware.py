@@ -0,0 +1,87 @@
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from core import metrics
+
+log = logging.getLogger("core.requests")
+
+class RequestMetricsMiddleware:
+    """
+    SQL, чтение/запись показаний и сборка ответа за запрос (см. core.metrics):
+    заголовок Server-Timing, строка JSON в лог "core.requests" (INFO, а
+    дольше METRICS_SLOW_REQUEST_MS — WARNING) и агрегаты по view для
+    /metrics. Стоит первым в MIDDLEWARE, чтобы мерить и остальные слои.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token = metrics.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.stop(token)
+        self._finish(request, response, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats, token = metrics.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.stop(token)
+        self._finish(request, response, stats)
+        return response
+
+    def process_template_response(self, request, response):
+        # шаблон отрисуется сразу после этого хука — засекаем до post-render
+        stats = metrics.current()
+        if stats is not None:
+            t0 = time.perf_counter()
+
+            def rendered(response):
+                stats.add("serialize", time.perf_counter() - t0)
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def _finish(request, response, stats: metrics.RequestStats):
+        total_s = stats.elapsed()
+        match = request.resolver_match
+        view = match.view_name if match is not None else "unmatched"
+        metrics.record(view, response.status_code, stats, total_s)
+
+        timing = [f'{kind};dur={stats.seconds[kind] * 1000:.2f};desc="{stats.count[kind]}"'
+                  for kind in ("db", "flux", "flux_write") if stats.count[kind]]
+        if stats.count["serialize"]:
+            timing.append(f"serialize;dur={stats.seconds['serialize'] * 1000:.2f}")
+        timing.append(f"total;dur={total_s * 1000:.2f}")
+        response["Server-Timing"] = ", ".join(timing)
+
+        slow = total_s * 1000 >= settings.METRICS_SLOW_REQUEST_MS
+        level = logging.WARNING if slow else logging.INFO
+        if log.isEnabledFor(level):
+            log.log(level, json.dumps({
+                "method": request.method,
+                "path": request.path,
+                "view": view,
+                "status": response.status_code,
+                "ms": round(total_s * 1000, 2),
+                **{f"{kind}_n": stats.count[kind] for kind in metrics.KINDS[:-1]},
+                **{f"{kind}_ms": round(stats.seconds[kind] * 1000, 2) for kind in metrics.KINDS},
+            }, ensure_ascii=False))
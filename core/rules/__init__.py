@@ -0,0 +1,4 @@
+"""
+Движок правил: выражения Rule.expr компилируются один раз и вычисляются
+на каждое новое показание связанных через RuleSensor датчиков.
+"""
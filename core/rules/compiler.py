@@ -0,0 +1,99 @@
+"""
+Разбор и компиляция выражений правил (Rule.expr), напр. "pm2_5 > 50".
+
+Выражение разбирается стандартным ast и проверяется по белому списку
+узлов: числа, имена переменных, арифметика, сравнения, and/or/not и пара
+функций. Всё прочее (атрибуты, индексы, лямбды, строки, **) отвергается,
+поэтому проверенное дерево можно спокойно скомпилировать в байткод.
+
+В правилах с окном (Rule.window_s > 0) доступны агрегаты по окну от одной
+переменной: avg(x), min(x), max(x), count(x). Такой вызов заменяется на
+переменную "avg__x" — её значение движок берёт из скользящего окна.
+"""
+import ast
+import re
+
+class RuleSyntaxError(ValueError):
+    pass
+
+FUNCTIONS = {"abs": abs, "min": min, "max": max, "round": round}
+WINDOW_FUNCTIONS = ("avg", "min", "max", "count")
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.Name, ast.Load, ast.Constant, ast.Call,
+    ast.BoolOp, ast.And, ast.Or,
+    ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod,
+    ast.Compare, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq,
+)
+
+def _is_window_call(node: ast.Call) -> bool:
+    return (
+        isinstance(node.func, ast.Name) and node.func.id in WINDOW_FUNCTIONS
+        and len(node.args) == 1 and isinstance(node.args[0], ast.Name) and not node.keywords
+    )
+
+def parse(expr: str, windowed: bool = False) -> ast.Expression:
+    """
+    Разобрать и проверить выражение; RuleSyntaxError, если что-то не так.
+    windowed — разрешить агрегаты по окну (avg(x) и т.п.).
+    """
+    try:
+        tree = ast.parse((expr or "").strip(), mode="eval")
+    except SyntaxError as e:
+        raise RuleSyntaxError(f"синтаксическая ошибка: {e.msg}") from None
+
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise RuleSyntaxError(f"недопустимая конструкция: {type(node).__name__}")
+        if isinstance(node, ast.Constant) and type(node.value) not in (int, float, bool):
+            raise RuleSyntaxError(f"недопустимая константа: {node.value!r}")
+        if isinstance(node, ast.Name) and "__" in node.id:
+            raise RuleSyntaxError(f"недопустимое имя: {node.id}")
+        if isinstance(node, ast.Call):
+            if windowed and _is_window_call(node):
+                continue
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+                raise RuleSyntaxError("вызывать можно только " + ", ".join(FUNCTIONS))
+            if node.keywords or any(isinstance(a, ast.Starred) for a in node.args):
+                raise RuleSyntaxError(f"{node.func.id}(): только позиционные аргументы")
+    return tree
+
+def variables(tree: ast.Expression) -> frozenset[str]:
+    """Имена переменных выражения (без имён функций)."""
+    funcs = {id(n.func) for n in ast.walk(tree) if isinstance(n, ast.Call)}
+    return frozenset(
+        n.id for n in ast.walk(tree) if isinstance(n, ast.Name) and id(n) not in funcs
+    )
+
+class _WindowCalls(ast.NodeTransformer):
+    def visit_Call(self, node):
+        if _is_window_call(node):
+            name = ast.Name(id=f"{node.func.id}__{node.args[0].id}", ctx=ast.Load())
+            return ast.copy_location(name, node)
+        return self.generic_visit(node)
+
+def compile_expr(expr: str, windowed: bool = False):
+    """
+    Скомпилировать выражение в замыкание evaluate(values) -> результат,
+    где values — {имя переменной: значение}. У замыкания есть атрибут
+    names — множество переменных, которые оно ждёт в values; агрегаты
+    по окну (при windowed) приходят туда как "avg__x", "max__x" и т.п.
+    """
+    tree = parse(expr, windowed)
+    if windowed:
+        tree = ast.fix_missing_locations(_WindowCalls().visit(tree))
+    code = compile(tree, "<rule>", "eval")
+    env = {"__builtins__": {}, **FUNCTIONS}
+
+    def evaluate(values: dict):
+        return eval(code, env, values)
+
+    evaluate.names = variables(tree)
+    return evaluate
+
+_SLUG_RE = re.compile(r"\W+")
+
+def slug(name: str) -> str:
+    """Имя датчика -> имя переменной: "PM2.5" -> "pm2_5", "Влажность (почва)" -> "влажность_почва"."""
+    return _SLUG_RE.sub("_", name.strip().lower()).strip("_")
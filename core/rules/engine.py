@@ -0,0 +1,232 @@
+"""
+Вычисление правил по потоку показаний и создание Alert.
+
+Правило компилируется один раз (compiler.compile_expr) и кэшируется до
+изменения Rule / RuleSensor / имени датчика (см. core.signals). Другие
+процессы (веб, симулятор) сигналов друг друга не видят, поэтому кэш
+дополнительно перечитывается раз в RULES_ENGINE_TTL_S.
+
+Переменные выражения привязываются к датчикам правила по псевдонимам:
+s<id>, sensor_<id> и slug(имени датчика). Если у правила один датчик и
+в выражении одна переменная, она привязывается к нему под любым именем.
+
+В правилах с окном (window_s > 0) avg(x)/min(x)/max(x)/count(x) берутся
+из скользящих окон (core.rules.windows) — без запросов к InfluxDB; голое
+имя переменной, как и без окна, — последнее значение датчика. Пока окно
+не накопило window_s секунд данных, правило не вычисляется.
+
+Alert создаётся по фронту: правило начало выполняться — тревога; пока
+условие держится, повторных тревог нет.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from core.rules.compiler import RuleSyntaxError, compile_expr, slug
+from core.rules.index import RuleIndex
+from core.rules.windows import WindowStore
+
+log = logging.getLogger(__name__)
+
+class RuleCompileError(RuleSyntaxError):
+    pass
+
+class CompiledRule:
+    __slots__ = ("rule_id", "name", "expr", "severity", "window_s", "evaluate", "bindings", "sensor_ids")
+
+    def __init__(self, rule_id, name, expr, severity, window_s, evaluate, bindings):
+        self.rule_id = rule_id
+        self.name = name
+        self.expr = expr
+        self.severity = severity
+        self.window_s = window_s
+        self.evaluate = evaluate
+        self.bindings = bindings   # ((переменная, sensor_id, агрегат окна или None), ...)
+        self.sensor_ids = frozenset(sid for _, sid, _ in bindings)
+
+    @property
+    def windows(self):
+        """Ключи (sensor_id, window_s) окон, нужных правилу."""
+        return {(sid, self.window_s) for _, sid, fn in self.bindings if fn}
+
+def _aliases(sensor) -> list[str]:
+    return [f"s{sensor.id}", f"sensor_{sensor.id}", slug(sensor.name)]
+
+def compile_rule(rule) -> CompiledRule:
+    """
+    Скомпилировать Rule (с предзагруженными rule.sensors) в CompiledRule.
+    RuleSyntaxError — выражение не разобралось, RuleCompileError — есть
+    переменные, которые не удалось привязать к датчикам правила.
+    """
+    evaluate = compile_expr(rule.expr, windowed=rule.window_s > 0)
+    sensors = list(rule.sensors.all())
+
+    by_alias = {}
+    for s in sensors:
+        for alias in _aliases(s):
+            by_alias.setdefault(alias, s.id)
+
+    # "avg__x" -> ("x", "avg"), "x" -> ("x", None)
+    refs = {}
+    for name in evaluate.names:
+        fn, _, var = name.rpartition("__")
+        refs[name] = (var, fn or None)
+    variables = {var for var, _ in refs.values()}
+    unbound = {var for var in variables if var not in by_alias}
+    if len(unbound) == 1 and len(variables) == 1 and len(sensors) == 1:
+        by_alias[next(iter(unbound))] = sensors[0].id
+        unbound = set()
+    if unbound:
+        raise RuleCompileError("не привязаны к датчикам правила: " + ", ".join(sorted(unbound)))
+
+    bindings = {name: (by_alias[var], fn) for name, (var, fn) in refs.items()}
+
+    return CompiledRule(
+        rule_id=rule.id,
+        name=rule.name,
+        expr=rule.expr,
+        severity=rule.severity,
+        window_s=rule.window_s,
+        evaluate=evaluate,
+        bindings=tuple(sorted((name, sid, fn) for name, (sid, fn) in bindings.items())),
+    )
+
+class RuleEngine:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rules: RuleIndex | None = None
+        self._loaded_at = 0.0
+        self._values: dict[int, tuple] = {}   # sensor_id -> (ts, value)
+        self._firing: set[int] = set()
+        self._windows = WindowStore()
+
+    # ----- кэш скомпилированных правил -----
+    def _load(self) -> RuleIndex:
+        from core.models import Rule
+
+        rules = RuleIndex()
+        for rule in Rule.objects.filter(enabled=True).prefetch_related("sensors"):
+            try:
+                rules.add(compile_rule(rule))
+            except RuleSyntaxError as e:
+                log.warning("rule %s (%r) skipped: %s", rule.id, rule.expr, e)
+        return rules
+
+    def rules(self) -> RuleIndex:
+        """Скомпилированные включённые правила с индексом по датчикам."""
+        with self._lock:
+            expired = time.monotonic() - self._loaded_at > settings.RULES_ENGINE_TTL_S
+            if self._rules is None or expired:
+                self._rules = self._load()
+                self._loaded_at = time.monotonic()
+                self._firing = {i for i in self._firing if i in self._rules}
+                self._sync_windows()
+            return self._rules
+
+    def _sync_windows(self):
+        self._windows.sync(key for rule in self._rules for key in rule.windows)
+
+    def invalidate(self, rule_id: int | None = None):
+        """
+        Сбросить одно правило и сразу перекомпилировать его из БД (выключенное
+        или удалённое просто пропадёт); без rule_id — сбросить все, они
+        перечитаются при следующем обращении.
+        """
+        with self._lock:
+            if rule_id is None or self._rules is None:
+                self._rules = None
+                return
+            self._rules.remove(rule_id)
+            self._firing.discard(rule_id)
+            self._reload_one(rule_id)
+            self._sync_windows()
+
+    def invalidate_sensor(self, sensor_id: int):
+        """Датчик переименован/удалён — перекомпилировать правила, где он участвует."""
+        with self._lock:
+            if self._rules is None:
+                return
+            for rule_id in self._rules.rule_ids_for_sensor(sensor_id):
+                self.invalidate(rule_id)
+
+    def _reload_one(self, rule_id: int):
+        from core.models import Rule
+
+        rule = Rule.objects.filter(pk=rule_id, enabled=True).prefetch_related("sensors").first()
+        if rule is None:
+            return
+        try:
+            self._rules.add(compile_rule(rule))
+        except RuleSyntaxError as e:
+            log.warning("rule %s (%r) skipped: %s", rule.id, rule.expr, e)
+
+    # ----- вычисление -----
+    def _values_for(self, rule: CompiledRule):
+        """{переменная: значение} для правила; None, если чего-то ещё нет."""
+        values = {}
+        for name, sensor_id, fn in rule.bindings:
+            if fn is None:
+                rec = self._values.get(sensor_id)
+                value = rec[1] if rec is not None else None
+            else:
+                value = self._windows.get(sensor_id, rule.window_s).value(fn)
+            if value is None:
+                return None
+            values[name] = value
+        return values
+
+    def _check(self, rule: CompiledRule, values: dict):
+        """True/False — результат правила; None — ошибка вычисления."""
+        try:
+            return bool(rule.evaluate(values))
+        except (ArithmeticError, TypeError, ValueError) as e:
+            log.warning("rule %s (%r) failed: %s", rule.rule_id, rule.expr, e)
+            return None
+
+    def process(self, readings):
+        """
+        Учесть показания [(sensor_id, ts, value), ...] по порядку: после каждого
+        перевычислить только правила, где участвует датчик (по индексу), и
+        создать Alert по тем, что только что сработали. Вернёт созданные Alert.
+        """
+        from core.models import Alert
+
+        alerts = []
+        with self._lock:
+            rules = self.rules()
+            for sensor_id, ts, value in readings:
+                sensor_id = int(sensor_id)
+                prev = self._values.get(sensor_id)
+                if prev is not None and ts < prev[0]:
+                    continue   # запоздавшая точка, текущее значение уже новее
+                self._values[sensor_id] = (ts, float(value))
+                self._windows.push(sensor_id, ts.timestamp(), float(value))
+
+                for rule in rules.dependents(sensor_id):
+                    values = self._values_for(rule)
+                    result = None if values is None else self._check(rule, values)
+                    if result is None:
+                        continue
+                    if result and rule.rule_id not in self._firing:
+                        self._firing.add(rule.rule_id)
+                        alerts.append(Alert(rule_id=rule.rule_id, started_at=ts, message=self._message(rule, values)))
+                    elif not result:
+                        self._firing.discard(rule.rule_id)
+        if alerts:
+            alerts = Alert.objects.bulk_create(alerts)
+            for a in alerts:
+                log.info("rule %s fired: %s", a.rule_id, a.message)
+        return alerts
+
+    def _message(self, rule: CompiledRule, values: dict) -> str:
+        shown = ", ".join(
+            f"{fn}({name.rpartition('__')[2]})={values[name]:g}" if fn else f"{name}={values[name]:g}"
+            for name, _, fn in rule.bindings
+        )
+        if rule.window_s:
+            shown += f", окно {rule.window_s} с"
+        return f"{rule.expr} ({shown})" if shown else rule.expr
+
+engine = RuleEngine()
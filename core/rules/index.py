@@ -0,0 +1,52 @@
+"""
+Обратный индекс sensor_id -> скомпилированные правила, где датчик участвует.
+
+На каждое показание движок берёт из индекса только зависимые правила, так
+что работа на точку пропорциональна числу таких правил, а не всем правилам.
+"""
+
+class RuleIndex:
+    def __init__(self, rules=()):
+        self._rules = {}       # rule_id -> CompiledRule
+        self._by_sensor = {}   # sensor_id -> {rule_id: CompiledRule}
+        for rule in rules:
+            self.add(rule)
+
+    def __len__(self):
+        return len(self._rules)
+
+    def __contains__(self, rule_id):
+        return rule_id in self._rules
+
+    def __iter__(self):
+        return iter(self._rules.values())
+
+    def get(self, rule_id):
+        return self._rules.get(rule_id)
+
+    def add(self, rule):
+        """Добавить правило (заменив прежнюю версию с тем же rule_id)."""
+        self.remove(rule.rule_id)
+        self._rules[rule.rule_id] = rule
+        for sensor_id in rule.sensor_ids:
+            self._by_sensor.setdefault(sensor_id, {})[rule.rule_id] = rule
+
+    def remove(self, rule_id):
+        rule = self._rules.pop(rule_id, None)
+        if rule is None:
+            return None
+        for sensor_id in rule.sensor_ids:
+            dependents = self._by_sensor.get(sensor_id)
+            if dependents is not None:
+                dependents.pop(rule_id, None)
+                if not dependents:
+                    del self._by_sensor[sensor_id]
+        return rule
+
+    def dependents(self, sensor_id):
+        """Правила, которые надо перевычислить при новом значении датчика."""
+        dependents = self._by_sensor.get(sensor_id)
+        return tuple(dependents.values()) if dependents else ()
+
+    def rule_ids_for_sensor(self, sensor_id):
+        return list(self._by_sensor.get(sensor_id, ()))
@@ -0,0 +1,105 @@
+"""
+Скользящие окна для правил с Rule.window_s: avg/min/max/count за последние
+window_s секунд по каждому датчику.
+
+Окно — кольцевой буфер точек (deque) с бегущими суммой и счётчиком для
+среднего и монотонными деками для min/max, так что добавление точки и
+любой агрегат стоят O(1) (амортизированно). В окне лежат только точки за
+window_s, то есть память ограничена window_s / sampling_s точек.
+Одно окно (датчик, ширина) общее для всех правил, которым оно нужно.
+"""
+from collections import deque
+
+AGGREGATES = ("avg", "min", "max", "count")
+
+class SlidingWindow:
+    __slots__ = ("window_s", "_points", "_sum", "_mins", "_maxs", "_started", "_last")
+
+    def __init__(self, window_s: float):
+        self.window_s = window_s
+        self._points = deque()   # (ts, value) по возрастанию ts
+        self._sum = 0.0
+        self._mins = deque()     # кандидаты в минимум: значения возрастают
+        self._maxs = deque()     # кандидаты в максимум: значения убывают
+        self._started = None     # время первой точки — от него считается прогрев
+        self._last = None
+
+    def push(self, ts: float, value: float):
+        """Добавить точку (ts — секунды, не убывают) и выкинуть вышедшие из окна."""
+        if self._started is None:
+            self._started = ts
+        self._last = ts
+        self._points.append((ts, value))
+        self._sum += value
+        while self._mins and self._mins[-1][1] >= value:
+            self._mins.pop()
+        self._mins.append((ts, value))
+        while self._maxs and self._maxs[-1][1] <= value:
+            self._maxs.pop()
+        self._maxs.append((ts, value))
+        self._evict(ts - self.window_s)
+
+    def _evict(self, cutoff: float):
+        points = self._points
+        while points and points[0][0] <= cutoff:
+            _, value = points.popleft()
+            self._sum -= value
+        if not points:
+            self._sum = 0.0   # не копить ошибку округления
+        while self._mins and self._mins[0][0] <= cutoff:
+            self._mins.popleft()
+        while self._maxs and self._maxs[0][0] <= cutoff:
+            self._maxs.popleft()
+
+    @property
+    def ready(self) -> bool:
+        """Окно прогрето: точки копятся уже не меньше window_s."""
+        return bool(self._points) and self._last - self._started >= self.window_s
+
+    def count(self) -> int:
+        return len(self._points)
+
+    def avg(self) -> float:
+        return self._sum / len(self._points)
+
+    def min(self) -> float:
+        return self._mins[0][1]
+
+    def max(self) -> float:
+        return self._maxs[0][1]
+
+    def value(self, fn: str):
+        """Агрегат по имени из AGGREGATES; None, пока окно не прогрето."""
+        if not self.ready:
+            return None
+        return getattr(self, fn)()
+
+class WindowStore:
+    """Окна по ключу (sensor_id, window_s), общие для всех правил."""
+
+    def __init__(self):
+        self._windows = {}     # (sensor_id, window_s) -> SlidingWindow
+        self._by_sensor = {}   # sensor_id -> (SlidingWindow, ...)
+
+    def __len__(self):
+        return len(self._windows)
+
+    def get(self, sensor_id: int, window_s: float):
+        return self._windows.get((sensor_id, window_s))
+
+    def sync(self, keys):
+        """
+        Оставить окна только для нужных ключей (sensor_id, window_s):
+        существующие сохраняются вместе с накопленными точками, недостающие
+        заводятся пустыми, ненужные выбрасываются.
+        """
+        keys = set(keys)
+        self._windows = {k: self._windows.get(k) or SlidingWindow(k[1]) for k in keys}
+        by_sensor = {}
+        for (sensor_id, _), window in self._windows.items():
+            by_sensor.setdefault(sensor_id, []).append(window)
+        self._by_sensor = {k: tuple(v) for k, v in by_sensor.items()}
+
+    def push(self, sensor_id: int, ts: float, value: float):
+        for window in self._by_sensor.get(sensor_id, ()):
+            window.push(ts, value)
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+# Отправляется core.influx после каждой записи показаний:
+# readings=[(sensor_id, ts: datetime, value: float), ...]
+readings_written = Signal()
+
+
+@receiver(readings_written)
+def evaluate_rules(sender, readings, **kwargs):
+    if settings.RULES_ENGINE_ENABLED:
+        from core.rules.engine import engine
+        engine.process(readings)
+
+
+@receiver(readings_written)
+def publish_live(sender, readings, **kwargs):
+    from core.live import hub
+    hub.publish_readings(readings)
+
+
+@receiver(post_save, sender="core.Rule")
+@receiver(post_delete, sender="core.Rule")
+def invalidate_rule(sender, instance, **kwargs):
+    from core.rules.engine import engine
+    engine.invalidate(instance.pk)
+
+
+@receiver(post_save, sender="core.RuleSensor")
+@receiver(post_delete, sender="core.RuleSensor")
+def invalidate_rule_link(sender, instance, **kwargs):
+    from core.rules.engine import engine
+    engine.invalidate(instance.rule_id)
+
+
+@receiver(post_save, sender="core.Sensor")
+@receiver(post_delete, sender="core.Sensor")
+def invalidate_sensor_rules(sender, instance, **kwargs):
+    from core.rules.engine import engine
+    engine.invalidate_sensor(instance.pk)
+
+
+@receiver(post_save, sender="core.Sensor")
+@receiver(post_delete, sender="core.Sensor")
+def invalidate_ingest_sensors(sender, instance, **kwargs):
+    from core.ingest import sensors
+    sensors.invalidate()
+
+
+@receiver(post_save, sender="core.Sensor")
+@receiver(post_delete, sender="core.Sensor")
+@receiver(post_save, sender="core.Actuator")
+@receiver(post_delete, sender="core.Actuator")
+@receiver(post_save, sender="core.Facility")
+@receiver(post_delete, sender="core.Facility")
+@receiver(post_save, sender="core.Rule")
+@receiver(post_delete, sender="core.Rule")
+@receiver(post_save, sender="core.Unit")
+@receiver(post_delete, sender="core.Unit")
+def invalidate_cached_pages(sender, instance, **kwargs):
+    from core import stats, versions
+    stats.invalidate()
+    versions.bump(sender._meta.label_lower)
+
+
+@receiver(connection_created)
+def instrument_db_connection(sender, connection, **kwargs):
+    from core import metrics
+    metrics.instrument_connection(connection)
@@ -0,0 +1,41 @@
+"""
+Счётчики для панели (portal: dashboard) в кэше "default".
+
+Каждая модель считается одним запросом с условным Count(filter=Q(...));
+итог вместе со списком активных датчиков для плиток лежит в кэше, пока
+core.signals не сбросит его после правки Sensor / Actuator / Facility /
+Rule / Unit. Сигналы видны только своему процессу, поэтому запись живёт
+не дольше DASHBOARD_STATS_TIMEOUT.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+CACHE_KEY = "dashboard:stats"
+
+def _collect() -> dict:
+    from core.models import Actuator, Facility, Rule, Sensor
+
+    active = Count("id", filter=Q(is_active=True))
+    sensors = Sensor.objects.aggregate(total=Count("id"), active=active)
+    actuators = Actuator.objects.aggregate(total=Count("id"), active=active)
+    return {
+        "sensors_total": sensors["total"],
+        "sensors_active": sensors["active"],
+        "actuators_total": actuators["total"],
+        "actuators_active": actuators["active"],
+        "facilities": Facility.objects.count(),
+        "rules": Rule.objects.count(),
+        "active_sensors": list(
+            Sensor.objects.filter(is_active=True)
+            .values("id", "name", "facility__name", "unit__code")
+            .order_by("facility__name", "name")
+        ),
+    }
+
+def dashboard_stats() -> dict:
+    """Счётчики панели и активные датчики (id, name, facility__name, unit__code)."""
+    return cache.get_or_set(CACHE_KEY, _collect, timeout=settings.DASHBOARD_STATS_TIMEOUT)
+
+def invalidate():
+    cache.delete(CACHE_KEY)
@@ -1,3 +1,243 @@
-from django.test import TestCase
+import tempfile
+import time
+from datetime import datetime, timezone
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from core import influx, ingest
+from core.ingest import IngestError
+from core.rules.compiler import RuleSyntaxError, compile_expr, parse
+from core.rules.windows import SlidingWindow, WindowStore
+from core.tsdb import LocalTSDB
+
+
+class CompilerTests(SimpleTestCase):
+    def test_evaluates_arithmetic_and_comparisons(self):
+        evaluate = compile_expr("abs(t - 20) > 5 and not door")
+        self.assertEqual(evaluate.names, {"t", "door"})
+        self.assertTrue(evaluate({"t": 26, "door": False}))
+        self.assertFalse(evaluate({"t": 24, "door": False}))
+
+    def test_rejects_unsafe_constructs(self):
+        for expr in (
+            "t.__class__",              # атрибут
+            "().__class__",
+            "t[0]",                     # индекс
+            "open('x')",                # вызов не из белого списка
+            "__import__('os')",
+            "eval('1')",
+            "(lambda: 1)()",
+            "2 ** 1000000",             # степень
+            "t == 'x'",                 # строка
+            "__builtins__",             # dunder-имя
+            "a__b > 1",
+            "max(*t)",
+            "round(t, ndigits=1)",
+            "[t for t in x]",
+        ):
+            with self.subTest(expr=expr), self.assertRaises(RuleSyntaxError):
+                parse(expr)
+
+    def test_syntax_error_is_rule_syntax_error(self):
+        with self.assertRaises(RuleSyntaxError):
+            parse("t >")
+
+    def test_window_calls_only_when_windowed(self):
+        with self.assertRaises(RuleSyntaxError):
+            parse("avg(t) > 1")
+        evaluate = compile_expr("avg(t) > 1 and max(t) < 10", windowed=True)
+        self.assertEqual(evaluate.names, {"avg__t", "max__t"})
+        self.assertTrue(evaluate({"avg__t": 2, "max__t": 5}))
+
+    def test_no_builtins_at_runtime(self):
+        evaluate = compile_expr("x")
+        with self.assertRaises(NameError):
+            evaluate({})
+
+
+class SlidingWindowTests(SimpleTestCase):
+    def test_aggregates_over_expiry(self):
+        w = SlidingWindow(10)
+        for ts, value in [(0, 5.0), (3, 1.0), (6, 9.0), (9, 3.0)]:
+            w.push(ts, value)
+        self.assertFalse(w.ready)
+        self.assertIsNone(w.value("avg"))
+
+        w.push(10, 4.0)   # точка ts=0 выходит из окна (0 <= 10 - 10)
+        self.assertTrue(w.ready)
+        self.assertEqual(w.value("count"), 4)
+        self.assertAlmostEqual(w.value("avg"), (1 + 9 + 3 + 4) / 4)
+        self.assertEqual(w.value("min"), 1.0)
+        self.assertEqual(w.value("max"), 9.0)
+
+        w.push(16, 2.0)   # вышли 3 и 6: минимум 1 и максимум 9 уходят
+        self.assertEqual(w.value("count"), 3)
+        self.assertAlmostEqual(w.value("avg"), 3.0)
+        self.assertEqual(w.value("min"), 2.0)
+        self.assertEqual(w.value("max"), 4.0)
+
+    def test_everything_expires_after_gap(self):
+        w = SlidingWindow(5)
+        w.push(0, 100.0)
+        w.push(1, -100.0)
+        w.push(20, 7.0)
+        self.assertEqual(w.value("count"), 1)
+        self.assertEqual(w.value("avg"), 7.0)
+        self.assertEqual(w.value("min"), 7.0)
+        self.assertEqual(w.value("max"), 7.0)
+
+    def test_store_keeps_points_across_sync(self):
+        store = WindowStore()
+        store.sync([(1, 10)])
+        store.push(1, 0, 1.0)
+        store.push(2, 0, 5.0)   # для датчика 2 окон нет
+        store.sync([(1, 10), (2, 10)])
+        self.assertEqual(store.get(1, 10).count(), 1)
+        self.assertEqual(store.get(2, 10).count(), 0)
+        store.sync([(2, 10)])
+        self.assertIsNone(store.get(1, 10))
+
+
+class ParseTests(SimpleTestCase):
+    def test_json(self):
+        body = b'[{"id": 1, "t": 1700000000000, "v": 21.5}, {"id": 2, "v": 3}]'
+        self.assertEqual(ingest.parse_json(body), [(1, 1700000000000, 21.5), (2, None, 3)])
+
+    def test_json_errors(self):
+        for body in (b"not json", b'{"id": 1}', b"[1, 2]"):
+            with self.subTest(body=body), self.assertRaises(IngestError):
+                ingest.parse_json(body)
+
+    def test_line_protocol(self):
+        text = (
+            "# комментарий\n"
+            "\n"
+            "readings,sensor_id=1 value=21.5 1700000000000000000\n"
+            "readings,sensor_id=2 value=3i\n"
+        )
+        self.assertEqual(ingest.parse_line_protocol(text), [(1, 1700000000000000000, 21.5), (2, None, 3.0)])
+        self.assertEqual(ingest.parse_line_protocol("readings,sensor_id=1 value=1 1700000000", "s"),
+                         [(1, 1700000000000000000, 1.0)])
+
+    def test_line_protocol_errors(self):
+        for text, precision in (
+            ("readings,sensor_id=1 value=1", "h"),
+            ("other,sensor_id=1 value=1", "ns"),
+            ("readings,sensor_id=x value=1", "ns"),
+            ("readings,sensor_id=1 value=abc", "ns"),
+        ):
+            with self.subTest(text=text), self.assertRaises(IngestError):
+                ingest.parse_line_protocol(text, precision)
+
+
+class IngestTests(SimpleTestCase):
+    TABLE = {1: (0.0, 100.0), 2: (None, None)}
+
+    def setUp(self):
+        patcher = mock.patch.object(ingest.sensors, "get", return_value=self.TABLE)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch("core.influx.write_readings")
+        self.write = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_accepts_and_stamps_missing_time(self):
+        accepted, rejected = ingest.ingest([(1, 1700000000000, 21.5), (2, None, -5)])
+        self.assertEqual((accepted, rejected), (2, []))
+        (written,), kwargs = self.write.call_args
+        self.assertEqual(written[0], (1, 1700000000000 * 1_000_000, 21.5))
+        self.assertEqual(written[1][0], 2)
+        self.assertIsInstance(written[1][1], int)
+        self.assertFalse(kwargs["sync"])
+
+    def test_per_reading_errors(self):
+        readings = [
+            ("1", None, 1.0),                 # id не целое
+            (True, None, 1.0),
+            (3, None, 1.0),                   # нет такого датчика
+            (1, None, "1"),                   # v не число
+            (1, None, float("nan")),
+            (1, None, 10 ** 400),             # целое, не влезающее во float
+            (1, None, 101.0),                 # вне [min_val, max_val]
+            (1, 1.5, 1.0),                    # t не целое
+            (1, 1700000000000000, 1.0),       # мкс вместо мс: за пределами int64 нс
+            (1, 2 ** 70, 1.0),
+            (1, -1, 1.0),
+            (1, 1700000000000, 50.0),         # годное
+        ]
+        accepted, rejected = ingest.ingest(readings)
+        self.assertEqual(accepted, 1)
+        self.assertEqual([r["index"] for r in rejected], list(range(11)))
+        self.assertTrue(all(r["error"] for r in rejected))
+        (written,), _ = self.write.call_args
+        self.assertEqual(written, [(1, 1700000000000 * 1_000_000, 50.0)])
+
+    def test_nothing_written_when_all_rejected(self):
+        self.assertEqual(ingest.ingest([(3, None, 1.0)])[0], 0)
+        self.write.assert_not_called()
+
+    def test_line_protocol_keeps_nanoseconds(self):
+        readings = ingest.parse_line_protocol(
+            "readings,sensor_id=1 value=1 1700000000000000100\n"
+            "readings,sensor_id=1 value=2 1700000000000000200\n"
+            "readings,sensor_id=1 value=3 9999999999999999999\n"
+            "readings,sensor_id=1 value=4 -1\n"
+        )
+        accepted, rejected = ingest.ingest(readings, t_scale=1)
+        self.assertEqual(accepted, 2)
+        self.assertEqual([r["index"] for r in rejected], [2, 3])
+        (written,), _ = self.write.call_args
+        self.assertEqual(written, [(1, 1700000000000000100, 1.0), (1, 1700000000000000200, 2.0)])
+
+
+class LatestCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches[influx.LATEST_CACHE].clear()
+        self.addCleanup(caches[influx.LATEST_CACHE].clear)
+        for patcher in (mock.patch("core.influx._local", return_value=None),
+                        mock.patch("core.influx._query_latest_adaptive", return_value={})):
+            self.query = patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_sensor_without_data_is_not_searched_again(self):
+        self.assertEqual(influx.latest_readings([1, 2]), {})
+        self.assertEqual(influx.latest_readings([1, 2]), {})
+        self.query.assert_called_once()
+
+    def test_write_replaces_no_data_mark(self):
+        influx.latest_readings([1])
+        ts = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        influx._remember_latest([(1, ts, 5.0)])
+        self.assertEqual(influx.latest_readings([1]), {1: (ts, 5.0)})
+        self.query.assert_called_once()
+
+
+class LocalTSDBTests(SimpleTestCase):
+    @override_settings(TSDB_FLUSH_MS=50)
+    def test_pending_points_reach_files_without_next_append(self):
+        with tempfile.TemporaryDirectory() as path:
+            LocalTSDB(path).append([1, 1], [2, 1], [2.0, 1.0])
+            other = LocalTSDB(path)   # другой процесс видит только файлы
+            deadline = time.monotonic() + 5
+            while not other.series([1]) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            ts_ns, values = other.series([1])[1]
+            self.assertEqual(ts_ns.tolist(), [1, 2])
+            self.assertEqual(values.tolist(), [1.0, 2.0])
+
+
+class WindowEveryTests(SimpleTestCase):
+    def test_point_cap_holds_for_any_range(self):
+        for rng in ("1s", "90s", "30m", "24h", "30d"):
+            for points in (1, 7, 2000):
+                with self.subTest(rng=rng, points=points):
+                    every = influx.window_every(rng, points)
+                    range_ms = influx.parse_range(rng).total_seconds() * 1000
+                    # окон, которые задевает диапазон, выровненный как угодно
+                    self.assertLessEqual(range_ms // every + 1, points)
+
+    def test_sub_second_buckets(self):
+        self.assertEqual(influx.window_every("30m", 2000), 901)
+        self.assertEqual(influx.window_every("1s", 2000), 1)
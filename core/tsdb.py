@@ -0,0 +1,220 @@
+"""
+Встроенное хранилище показаний — замена InfluxDB для локальной работы,
+тестов и замеров (TSDB_BACKEND = "local", см. core.influx).
+
+У каждого сенсора свой каталог под TSDB_PATH с файлами записей
+(ts: int64 нс, value: float64) по 16 байт, без заголовка:
+- head.bin — в него дописываются новые точки (O_APPEND);
+- seg-<нс>.bin — запечатанные сегменты: head.bin переименовывается, когда
+  в нём набирается TSDB_SEGMENT_POINTS точек. Сегменты неизменны и
+  читаются через np.memmap, диапазон по времени — бинарным поиском.
+Точки копятся в памяти процесса и уходят в файлы раз в TSDB_FLUSH_MS (или
+сразу при sync / flush()), поэтому другие процессы видят их с такой
+задержкой. Запоздавшие точки допустимы: файл, где время не по возрастанию,
+читается полным просмотром вместо бинарного поиска, а результат
+досортировывается. Последняя точка ищется только в head.bin, самом новом
+сегменте и ещё не записанном.
+"""
+import atexit
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+RECORD = np.dtype([("t", "<i8"), ("v", "<f8")])
+
+_EMPTY = np.empty(0, dtype=RECORD)
+
+def _is_sorted(chunk: np.ndarray) -> bool:
+    return len(chunk) < 2 or not (np.diff(chunk["t"]) < 0).any()
+
+class _Sensor:
+    """Файлы одного сенсора: запечатанные сегменты (memmap, отсортирован ли) и head.bin."""
+    __slots__ = ("path", "segments", "mtime")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.segments: list[tuple[np.ndarray, bool]] = []
+        self.mtime = None
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self.segments, self.mtime = [], None
+            return
+        if mtime == self.mtime:
+            return
+        names = sorted(n for n in os.listdir(self.path) if n.startswith("seg-"))
+        segments = []
+        for name in names:
+            m = _map(os.path.join(self.path, name))
+            if len(m):
+                segments.append((m, _is_sorted(m)))
+        self.segments = segments
+        self.mtime = mtime
+
+    def chunks(self) -> list[tuple[np.ndarray, bool]]:
+        """[(записи, отсортированы ли), ...]: сегменты по порядку, последним — head.bin."""
+        self._refresh()
+        head = _map(os.path.join(self.path, "head.bin"))
+        return [*self.segments, (head, _is_sorted(head))]
+
+def _map(path: str) -> np.ndarray:
+    """Файл записей как массив (memmap); недописанный хвост отбрасывается."""
+    try:
+        n = os.path.getsize(path) // RECORD.itemsize
+    except FileNotFoundError:
+        return _EMPTY
+    return np.memmap(path, dtype=RECORD, mode="r", shape=(n,)) if n else _EMPTY
+
+def _slice(chunk: np.ndarray, start_ns: int | None, end_ns: int | None, is_sorted: bool = True) -> np.ndarray:
+    t = chunk["t"]
+    if not is_sorted:
+        keep = np.ones(len(t), dtype=bool)
+        if start_ns is not None:
+            keep &= t >= start_ns
+        if end_ns is not None:
+            keep &= t <= end_ns
+        return chunk[keep]
+    lo = 0 if start_ns is None else np.searchsorted(t, start_ns, side="left")
+    hi = len(t) if end_ns is None else np.searchsorted(t, end_ns, side="right")
+    return chunk[lo:hi]
+
+class LocalTSDB:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._sensors: dict[int, _Sensor] = {}
+        self._pending: dict[int, list[np.ndarray]] = {}   # ещё не в файлах
+        self._flushed_at = time.monotonic()
+        self._timer: threading.Timer | None = None   # сброс отложенных точек
+        os.makedirs(path, exist_ok=True)
+
+    def _sensor(self, sensor_id: int) -> _Sensor:
+        s = self._sensors.get(sensor_id)
+        if s is None:
+            s = self._sensors[sensor_id] = _Sensor(os.path.join(self.path, str(sensor_id)))
+        return s
+
+    # ----- запись -----
+    def append(self, sensor_ids, ts_ns, values, sync: bool = False):
+        """Добавить точки (массивы одной длины); sync — сразу в файлы."""
+        sensor_ids = np.asarray(sensor_ids, dtype=np.int64)
+        recs = np.empty(len(sensor_ids), dtype=RECORD)
+        recs["t"], recs["v"] = ts_ns, values
+        order = np.argsort(sensor_ids, kind="stable")
+        sensor_ids, recs = sensor_ids[order], recs[order]
+        uniq, starts = np.unique(sensor_ids, return_index=True)
+        with self._lock:
+            for sid, part in zip(uniq.tolist(), np.split(recs, starts[1:])):
+                self._pending.setdefault(sid, []).append(part)
+            wait = settings.TSDB_FLUSH_MS / 1000 - (time.monotonic() - self._flushed_at)
+            if not sync and wait > 0 and self._timer is None:
+                # процесс может затихнуть после пачки — точки не должны ждать следующей
+                self._timer = threading.Timer(wait, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if sync or wait <= 0:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        for sid, parts in pending.items():
+            s = self._sensor(sid)
+            os.makedirs(s.path, exist_ok=True)
+            head = os.path.join(s.path, "head.bin")
+            fd = os.open(head, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, np.concatenate(parts).tobytes())
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+            if size >= settings.TSDB_SEGMENT_POINTS * RECORD.itemsize:
+                os.replace(head, os.path.join(s.path, f"seg-{time.time_ns()}.bin"))
+
+    # ----- чтение -----
+    def _records(self, sensor_id: int, start_ns=None, end_ns=None) -> np.ndarray:
+        parts = [_slice(c, start_ns, end_ns, ok) for c, ok in self._sensor(sensor_id).chunks()]
+        with self._lock:
+            pending = list(self._pending.get(sensor_id, ()))
+        parts += [_slice(p, start_ns, end_ns, _is_sorted(p)) for p in pending]
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return _EMPTY
+        recs = np.concatenate(parts) if len(parts) > 1 else parts[0]
+        if not _is_sorted(recs):
+            recs = recs[np.argsort(recs["t"], kind="stable")]
+        return recs
+
+    def series(self, sensor_ids, start_ns: int | None = None,
+               end_ns: int | None = None) -> dict[int, tuple[np.ndarray, np.ndarray]]:
+        """{sensor_id: (ts_ns[], value[])} в [start_ns, end_ns], по возрастанию времени."""
+        out = {}
+        for sid in sensor_ids:
+            recs = self._records(int(sid), start_ns, end_ns)
+            if len(recs):
+                out[int(sid)] = (recs["t"], recs["v"])
+        return out
+
+    def latest(self, sensor_ids, start_ns: int | None = None) -> dict[int, tuple[int, float]]:
+        """{sensor_id: (ts_ns, value)} — самая поздняя точка не раньше start_ns."""
+        out = {}
+        for sid in sensor_ids:
+            sid = int(sid)
+            with self._lock:
+                chunks = list(self._pending.get(sid, ()))
+            chunks += [c for c, _ in self._sensor(sid).chunks()[-2:]]
+            best = None
+            for chunk in chunks:
+                if len(chunk):
+                    rec = chunk[np.argmax(chunk["t"])]
+                    if best is None or rec["t"] > best["t"]:
+                        best = rec
+            if best is not None and (start_ns is None or best["t"] >= start_ns):
+                out[sid] = (int(best["t"]), float(best["v"]))
+        return out
+
+def aggregate(ts_ns: np.ndarray, values: np.ndarray, every_ns: int, fn: str):
+    """
+    Как aggregateWindow(every, fn, createEmpty: false, timeSrc: "_start"):
+    окна от эпохи шириной every_ns, по точке на непустое окно, время — начало
+    окна. fn — mean/min/max/last. ts_ns — по возрастанию.
+    """
+    if not len(ts_ns):
+        return ts_ns, values
+    buckets = ts_ns // every_ns
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    if fn == "mean":
+        agg = np.add.reduceat(values, starts) / np.diff(np.r_[starts, len(values)])
+    elif fn == "min":
+        agg = np.minimum.reduceat(values, starts)
+    elif fn == "max":
+        agg = np.maximum.reduceat(values, starts)
+    else:
+        agg = values[np.r_[starts[1:], len(values)] - 1]
+    return buckets[starts] * every_ns, agg
+
+# Как и клиент InfluxDB, хранилище пересоздаётся в дочернем процессе после
+# fork (несброшенный буфер родителя дочернему не достаётся) и при смене
+# TSDB_PATH (override_settings в замерах).
+_store: LocalTSDB | None = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+def store() -> LocalTSDB:
+    global _store, _store_pid
+    with _store_lock:
+        if _store is None or _store_pid != os.getpid() or _store.path != settings.TSDB_PATH:
+            if _store is not None and _store_pid == os.getpid():
+                _store.flush()
+            _store, _store_pid = LocalTSDB(settings.TSDB_PATH), os.getpid()
+            atexit.register(_store.flush)
+        return _store
@@ -0,0 +1,29 @@
+"""
+Версии таблиц для ключей кэша "default": версия модели растёт при каждой
+правке её строк (core.signals), поэтому всё, что закэшировано под старой
+версией, просто перестаёт находиться — удалять ничего не нужно.
+Если счётчик выпал из кэша, он заводится заново от текущего времени в нс,
+так что старые ключи не оживают.
+"""
+import time
+
+from django.core.cache import cache
+
+def _key(label: str) -> str:
+    return f"ver:{label}"
+
+def get(*labels: str) -> str:
+    """Версия набора моделей ("core.sensor", ...) одной строкой для ключа кэша."""
+    keys = [_key(label) for label in labels]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key)
+    return ".".join(str(found[key]) for key in keys)
+
+def bump(label: str):
+    try:
+        cache.incr(_key(label))
+    except ValueError:
+        cache.set(_key(label), time.time_ns(), timeout=None)
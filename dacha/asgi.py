@@ -3,6 +3,9 @@ ASGI config for dacha project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Живые обновления (portal: api/live/) работают только здесь, например:
+uvicorn dacha.asgi:application
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -126,6 +127,69 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [ BASE_DIR / "static" ]
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# "default" — страницы и API портала (счётчики панели, списки, версии
+# таблиц core.versions); по умолчанию в памяти процесса, общий на все
+# процессы — CACHE_URL=filecache:///var/tmp/dacha-cache или
+# CACHE_URL=rediscache://127.0.0.1:6379/0.
+# "latest" — последние значения датчиков (core.influx): по умолчанию
+# LocMemCache (LRU + TTL в памяти процесса), для общего на все процессы
+# кэша — LATEST_CACHE_URL=rediscache://127.0.0.1:6379/1
+
+CACHES = {
+    "default": env.cache_url(
+        "CACHE_URL", default="locmemcache://default?TIMEOUT=300&MAX_ENTRIES=10000"
+    ),
+    "latest": env.cache_url(
+        "LATEST_CACHE_URL", default="locmemcache://latest?TIMEOUT=3600&MAX_ENTRIES=100000"
+    ),
+}
+# Сессии — из кэша с записью в БД: страница не читает django_session
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+# Сколько держать списки портала и api/sensors под текущей версией таблиц, с
+LIST_CACHE_TIMEOUT = env.int("LIST_CACHE_TIMEOUT", default=600)
+# Сколько держать в кэше значение, прочитанное из InfluxDB при промахе, с
+LATEST_CACHE_FILL_TIMEOUT = env.int("LATEST_CACHE_FILL_TIMEOUT", default=5)
+# Поиск последней точки при промахе: первое окно — LATEST_WINDOW_PERIODS
+# периодов опроса датчика (но не меньше LATEST_MIN_WINDOW_S), дальше окно
+# растёт в LATEST_WINDOW_GROWTH раз до 30 дней
+LATEST_WINDOW_PERIODS = env.int("LATEST_WINDOW_PERIODS", default=5)
+LATEST_MIN_WINDOW_S = env.int("LATEST_MIN_WINDOW_S", default=30)
+LATEST_WINDOW_GROWTH = env.int("LATEST_WINDOW_GROWTH", default=4)
+LATEST_DEFAULT_SAMPLING_S = env.int("LATEST_DEFAULT_SAMPLING_S", default=10)
+
+# Движок правил (core.rules): вычислять ли правила на каждую запись
+# показаний в этом процессе и как часто перечитывать их из БД, с
+RULES_ENGINE_ENABLED = env.bool("RULES_ENGINE_ENABLED", default=True)
+RULES_ENGINE_TTL_S = env.int("RULES_ENGINE_TTL_S", default=60)
+
+# Приём показаний от устройств (POST api/ingest/): токены (через запятую),
+# потолок показаний в одном запросе и как часто перечитывать датчики, с.
+# Без токенов приём выключен
+INGEST_TOKENS = env.list("INGEST_TOKENS", default=[])
+INGEST_MAX_READINGS = env.int("INGEST_MAX_READINGS", default=20_000)
+INGEST_SENSORS_TTL_S = env.int("INGEST_SENSORS_TTL_S", default=30)
+
+# Живые обновления (SSE api/live/, только под ASGI): как часто общий
+# опросчик ищет новые значения и Alert, с; пинг при тишине, с; сколько
+# событий держать для медленного клиента
+LIVE_POLL_S = env.int("LIVE_POLL_S", default=2)
+LIVE_HEARTBEAT_S = env.int("LIVE_HEARTBEAT_S", default=15)
+LIVE_QUEUE_SIZE = env.int("LIVE_QUEUE_SIZE", default=100)
+
+# Счётчики панели в кэше "default" (core.stats): сбрасываются сигналами
+# при правке, но другие процессы их сигналов не видят — потолок жизни, с
+DASHBOARD_STATS_TIMEOUT = env.int("DASHBOARD_STATS_TIMEOUT", default=300)
+
+# Учёт запросов (core.middleware): Server-Timing, лог "core.requests" и
+# /metrics для Prometheus — только с этих адресов. Запросы дольше
+# METRICS_SLOW_REQUEST_MS пишутся в лог как WARNING
+METRICS_ENABLED = env.bool("METRICS_ENABLED", default=True)
+METRICS_ALLOWED_IPS = env.list("METRICS_ALLOWED_IPS", default=["127.0.0.1", "::1"])
+METRICS_SLOW_REQUEST_MS = env.int("METRICS_SLOW_REQUEST_MS", default=1_000)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -134,4 +198,25 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 INFLUX_URL = env("INFLUX_URL", default="http://127.0.0.1:8086")
 INFLUX_TOKEN = env("INFLUX_TOKEN", default="dev-token")
 INFLUX_ORG = env("INFLUX_ORG", default="smart")
-INFLUX_BUCKET = env("INFLUX_BUCKET", default="readings")
\ No newline at end of file
+INFLUX_BUCKET = env("INFLUX_BUCKET", default="readings")
+INFLUX_TIMEOUT_MS = env.int("INFLUX_TIMEOUT_MS", default=30_000)
+# Пакетная запись: точки копятся и уходят пачками по размеру или таймеру,
+# неудачные пачки повторяются с экспоненциальной задержкой
+INFLUX_BATCH_SIZE = env.int("INFLUX_BATCH_SIZE", default=1_000)
+INFLUX_FLUSH_INTERVAL_MS = env.int("INFLUX_FLUSH_INTERVAL_MS", default=1_000)
+INFLUX_RETRY_INTERVAL_MS = env.int("INFLUX_RETRY_INTERVAL_MS", default=5_000)
+INFLUX_MAX_RETRIES = env.int("INFLUX_MAX_RETRIES", default=5)
+INFLUX_MAX_RETRY_DELAY_MS = env.int("INFLUX_MAX_RETRY_DELAY_MS", default=125_000)
+INFLUX_EXPONENTIAL_BASE = env.int("INFLUX_EXPONENTIAL_BASE", default=2)
+
+# Хранилище показаний: "influx" — InfluxDB выше, "local" — встроенное
+# core.tsdb (файлы в TSDB_PATH), для работы и замеров без InfluxDB.
+# Сегмент запечатывается на TSDB_SEGMENT_POINTS точках, накопленное в
+# памяти уходит в файлы раз в TSDB_FLUSH_MS
+TSDB_BACKEND = env("TSDB_BACKEND", default="influx")
+TSDB_PATH = env("TSDB_PATH", default=str(BASE_DIR / "tsdb"))
+TSDB_SEGMENT_POINTS = env.int("TSDB_SEGMENT_POINTS", default=65_536)
+TSDB_FLUSH_MS = env.int("TSDB_FLUSH_MS", default=1_000)
+
+# Потолок точек в ответе рядов: длинные диапазоны прореживаются на сервере
+SERIES_MAX_POINTS = env.int("SERIES_MAX_POINTS", default=2000)
@@ -17,7 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
+from core.views import metrics_view
+
 urlpatterns = [
     path("", include("portal.urls", namespace="portal")),
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
 ]
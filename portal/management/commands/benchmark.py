@@ -0,0 +1,307 @@
+"""
+Замеры горячих путей без InfluxDB и без рабочей БД: показания пишутся во
+встроенное core.tsdb (во временный каталог), модели — в тестовую БД Django,
+которая создаётся на время прогона и засевается датчиками.
+
+Что меряется:
+- write: write_reading по одной точке и write_readings пачками (точек/с);
+- latest: latest_reading из кэша и с промахом кэша;
+- series: api_sensor_series за 1h/24h/30d при опросе раз в секунду (json и binary);
+- dashboard: отрисовка панели и число SQL-запросов на 10/100/1000 датчиков,
+  с холодным и тёплым кэшем счётчиков;
+- simulator: тик BatchSimulator на тех же наборах датчиков.
+
+Итог — JSON (--output), по каждому замеру время в мс (min/median/p95/mean)
+и его величины. --compare сверяет медианы с прошлым прогоном и падает, если
+что-то стало медленнее больше чем на --threshold.
+
+    python manage.py benchmark --output bench.json
+    python manage.py benchmark --only series,dashboard --compare bench.json
+"""
+import json
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import django
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, \
+    teardown_test_environment
+from django.utils import timezone as djtz
+
+from core import influx, stats
+from core.models import Alert, Facility, FacilityType, Rule, RuleSensor, Sensor, Unit
+from portal.management.commands.simulate_readings import BatchSimulator, build_plans
+
+GROUPS = ("write", "latest", "series", "dashboard", "simulator")
+SERIES_RANGES = ("1h", "24h", "30d")
+
+# Оба кэша — в памяти процесса, что бы ни стояло в CACHE_URL / LATEST_CACHE_URL
+BENCH_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "bench-default"},
+    "latest": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "bench-latest",
+               "OPTIONS": {"MAX_ENTRIES": 100_000}},
+}
+
+def _timings(samples_s: list[float]) -> dict:
+    ms = sorted(s * 1000 for s in samples_s)
+    return {
+        "n": len(ms),
+        "min_ms": round(ms[0], 4),
+        "median_ms": round(statistics.median(ms), 4),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 4),
+        "mean_ms": round(statistics.fmean(ms), 4),
+    }
+
+def _measure(fn, repeat: int, before=None) -> dict:
+    """Вызвать fn repeat раз (before — перед каждым, вне замера), вернуть _timings."""
+    samples = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return _timings(samples)
+
+def _git_revision() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+                             capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+class Command(BaseCommand):
+    help = "Замеры записи, чтения рядов, панели и симулятора на встроенном TSDB и тестовой БД"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--only", default=",".join(GROUPS),
+                            help=f"Какие группы мерить через запятую: {', '.join(GROUPS)}")
+        parser.add_argument("--repeat", type=int, default=20,
+                            help="Повторов на замер (по умолчанию 20)")
+        parser.add_argument("--sizes", default="10,100,1000",
+                            help="Число датчиков для dashboard и simulator (по умолчанию 10,100,1000)")
+        parser.add_argument("--writes", type=int, default=20_000,
+                            help="Точек на замер записи (по умолчанию 20000)")
+        parser.add_argument("--output", metavar="ПУТЬ",
+                            help="Куда записать JSON с результатами (по умолчанию — в stdout)")
+        parser.add_argument("--compare", metavar="ПУТЬ",
+                            help="JSON прошлого прогона: сравнить медианы")
+        parser.add_argument("--threshold", type=float, default=0.2,
+                            help="Допустимый рост медианы при --compare (доля, по умолчанию 0.2)")
+
+    def handle(self, *args, **opts):
+        groups = [g.strip() for g in opts["only"].split(",") if g.strip()]
+        unknown = set(groups) - set(GROUPS)
+        if unknown:
+            raise CommandError(f"Неизвестные группы: {', '.join(sorted(unknown))}")
+        try:
+            sizes = sorted({int(n) for n in opts["sizes"].split(",") if n.strip()})
+        except ValueError:
+            raise CommandError("--sizes: целые через запятую") from None
+        if opts["repeat"] < 1 or not sizes or sizes[0] < 1:
+            raise CommandError("--repeat и --sizes должны быть положительными")
+        self.repeat = opts["repeat"]
+        self.sizes = sizes
+        self.writes = opts["writes"]
+        baseline = self._load_baseline(opts["compare"]) if opts["compare"] else None
+
+        results = {}
+        with tempfile.TemporaryDirectory(prefix="bench-tsdb-") as tsdb_path, \
+                override_settings(TSDB_BACKEND="local", TSDB_PATH=tsdb_path, CACHES=BENCH_CACHES):
+            setup_test_environment()
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                self._seed()
+                for group in groups:
+                    self.stderr.write(f"[bench] {group}...")
+                    results.update(getattr(self, f"_bench_{group}")())
+                influx.flush()
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        report = {"meta": self._meta(groups), "results": results}
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if opts["output"]:
+            with open(opts["output"], "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+            self.stderr.write(f"[bench] written to {opts['output']}")
+        else:
+            self.stdout.write(text)
+
+        if baseline is not None:
+            self._compare(results, baseline, opts["threshold"])
+
+    def _meta(self, groups) -> dict:
+        return {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git": _git_revision(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "db": connection.vendor,
+            "groups": groups,
+            "repeat": self.repeat,
+            "sizes": self.sizes,
+            "writes": self.writes,
+        }
+
+    # ----- данные -----
+    def _seed(self):
+        self.user = get_user_model().objects.create_user("bench", password="bench")
+        self.unit = Unit.objects.create(code="°C", title="градусы Цельсия")
+        self.facility = Facility.objects.create(name="Замер", type=FacilityType.HOUSE)
+        # правило на первом датчике: запись идёт через движок правил, как в работе
+        rule = Rule.objects.create(user=self.user, name="Замер: перегрев", expr="t > 1000")
+        RuleSensor.objects.create(rule=rule, sensor_id=self._ensure_sensors(1)[0])
+        now = djtz.now()
+        Alert.objects.bulk_create(
+            Alert(rule=rule, started_at=now - timedelta(minutes=i), message=f"замер {i}") for i in range(10)
+        )
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def _ensure_sensors(self, n: int) -> list[int]:
+        """Довести число активных датчиков (опрос раз в секунду) до n, вернуть их id."""
+        have = Sensor.objects.count()
+        if have < n:
+            Sensor.objects.bulk_create(
+                Sensor(user=self.user, facility=self.facility, unit=self.unit, name=f"Датчик {i}",
+                       min_val=-50, max_val=150, sampling_s=1, is_active=True)
+                for i in range(have, n)
+            )
+            stats.invalidate()
+        return list(Sensor.objects.order_by("id").values_list("id", flat=True)[:n])
+
+    # ----- группы -----
+    def _bench_write(self) -> dict:
+        sid = self._ensure_sensors(1)[0]
+        n = self.writes
+        base_ns = influx._ts_ns(djtz.now()) - n * 1_000_000_000
+
+        t0 = time.perf_counter()
+        for i in range(n):
+            influx.write_reading(sid, base_ns + i * 1_000_000_000, 20.0 + i % 7)
+        single = time.perf_counter() - t0
+        influx.flush()
+
+        batch = 1_000
+        readings = [(sid, base_ns + i * 1_000_000, 20.0 + i % 7) for i in range(n)]
+        t0 = time.perf_counter()
+        for a in range(0, n, batch):
+            influx.write_readings(readings[a:a + batch], sync=False)
+        influx.flush()
+        batched = time.perf_counter() - t0
+
+        return {
+            "write_reading": {"points": n, "seconds": round(single, 4),
+                              "points_per_s": round(n / single), **_timings([single / n])},
+            "write_readings_batch_1000": {"points": n, "seconds": round(batched, 4),
+                                          "points_per_s": round(n / batched), **_timings([batched / (n / batch)])},
+        }
+
+    def _bench_latest(self) -> dict:
+        ids = self._ensure_sensors(max(self.sizes))
+        now_ns = influx._ts_ns(djtz.now())
+        influx.write_readings([(sid, now_ns, 1.0) for sid in ids])
+        latest_cache = caches[influx.LATEST_CACHE]
+        sid = ids[0]
+        return {
+            "latest_reading_cached": _measure(lambda: influx.latest_reading(sid, 1), self.repeat),
+            "latest_reading_miss": _measure(lambda: influx.latest_reading(sid, 1), self.repeat,
+                                            before=latest_cache.clear),
+            f"latest_readings_{len(ids)}_miss": _measure(lambda: influx.latest_readings(ids), self.repeat,
+                                                         before=latest_cache.clear),
+        }
+
+    def _bench_series(self) -> dict:
+        sid = self._ensure_sensors(1)[0]
+        end_ns = influx._ts_ns(djtz.now())
+        n = 30 * 24 * 3600
+        ts_ns = end_ns - np.arange(n, 0, -1, dtype=np.int64) * 1_000_000_000
+        influx.write_series(sid, ts_ns, 20.0 + np.sin(np.arange(n) / 3600.0))
+        out = {}
+        for rng in SERIES_RANGES:
+            for fmt in ("json", "binary"):
+                url = f"/api/sensors/{sid}/series/?range={rng}&format={fmt}"
+                response = self.client.get(url)
+                if response.status_code != 200:
+                    raise CommandError(f"{url}: HTTP {response.status_code}")
+                out[f"api_sensor_series_{rng}_{fmt}"] = {
+                    "bytes": len(response.content), **_measure(lambda: self.client.get(url), self.repeat),
+                }
+        return out
+
+    def _bench_dashboard(self) -> dict:
+        out = {}
+        for n in self.sizes:
+            self._ensure_sensors(n)
+            stats.invalidate()
+            # captured_queries — срез connection.queries, который следующий
+            # запрос сбрасывает (request_started): считать сразу
+            with CaptureQueriesContext(connection) as cold:
+                self.client.get("/")
+            n_cold = len(cold.captured_queries)
+            with CaptureQueriesContext(connection) as warm:
+                response = self.client.get("/")
+            n_warm = len(warm.captured_queries)
+            if response.status_code != 200:
+                raise CommandError(f"dashboard: HTTP {response.status_code}")
+            out[f"dashboard_{n}_cold"] = {
+                "sensors": n, "queries": n_cold,
+                **_measure(lambda: self.client.get("/"), self.repeat, before=stats.invalidate),
+            }
+            out[f"dashboard_{n}_warm"] = {
+                "sensors": n, "queries": n_warm,
+                **_measure(lambda: self.client.get("/"), self.repeat),
+            }
+        return out
+
+    def _bench_simulator(self) -> dict:
+        out = {}
+        for n in self.sizes:
+            ids = self._ensure_sensors(n)
+            sensors = list(Sensor.objects.filter(id__in=ids).select_related("facility"))
+            sim = BatchSimulator(build_plans(sensors))
+            # каждый тик на секунду позже прошлого — созревают все датчики
+            clock = iter(djtz.now() + timedelta(seconds=i) for i in range(self.repeat + 1))
+            sim.tick(next(clock), sync=False)
+            out[f"simulator_tick_{n}"] = {
+                "sensors": n, **_measure(lambda: sim.tick(next(clock), sync=False), self.repeat),
+            }
+        return out
+
+    # ----- сравнение -----
+    @staticmethod
+    def _load_baseline(path: str) -> dict:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)["results"]
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"--compare {path}: {e}") from None
+
+    def _compare(self, results: dict, baseline: dict, threshold: float):
+        slower = []
+        for name, cur in results.items():
+            old = baseline.get(name)
+            if not old or not old.get("median_ms"):
+                continue
+            ratio = cur["median_ms"] / old["median_ms"]
+            mark = "  <-- медленнее" if ratio > 1 + threshold else ""
+            self.stderr.write(f"{name:40} {old['median_ms']:>10.3f} -> {cur['median_ms']:>10.3f} ms  x{ratio:.2f}{mark}")
+            if mark:
+                slower.append(name)
+        if slower:
+            raise CommandError(f"Медленнее больше чем на {threshold:.0%}: {', '.join(slower)}")
@@ -1,137 +1,197 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import queue
 import random
+import signal
 import time
+from datetime import datetime, timezone
 from typing import Callable, Dict, Union, Tuple, Iterable
 
 import numpy as np
-from django.core.management.base import BaseCommand
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import F
 from django.utils import timezone as djtz
+from django.utils.dateparse import parse_date, parse_datetime
 
 from core.models import Sensor
 from core import influx
 
-_last_written: Dict[int, 'datetime'] = {}
+# Генераторы принимают x — час суток (скаляр или массив NumPy) и s — датчик
+# (или SensorBatch с массивами полей) и возвращают значение той же формы,
+# что и x: так одна функция считает и один датчик, и целую группу за раз.
+
+def _noise(x, scale):
+    return np.random.normal(scale=scale, size=np.shape(x))
+
+def _rare(x, high):
+    return (np.random.randint(0, high, size=np.shape(x)) == 24).astype(float)
 
 def home_temperature(x, s=None):
-    return np.sin(x * np.pi / 12 - np.pi / 2) * 10.0 + 20.0 + np.random.normal(scale=1/50)
+    return np.sin(x * np.pi / 12 - np.pi / 2) * 10.0 + 20.0 + _noise(x, 1/50)
 
 def power_consumption(x, s=None):
-    value = np.sin(x * np.pi / 12 - np.pi / 2) * 7500 + 5000 + np.random.normal(scale=5000)
-    np.clip(value, 0, 15000, out=value)
-    return value
+    value = np.sin(x * np.pi / 12 - np.pi / 2) * 7500 + 5000 + _noise(x, 5000)
+    return np.clip(value, 0, 15000)
 
 def rare_bool(x, s=None):
-    value = np.random.randint(0, 200)
-    return 1 if value == 24 else 0
+    return _rare(x, 200)
 
 def morning_evening_bool(x, s=None):
-    if 8 < x < 10 or 19 < x < 22:
-        value = np.random.randint(0, 30)
-        return 1 if value == 24 else 0
-    else:
-        value = np.random.randint(0, 200)
-        return 1 if value == 24 else 0
+    busy = ((8 < x) & (x < 10)) | ((19 < x) & (x < 22))
+    return np.where(busy, _rare(x, 30), _rare(x, 200))
 
 def humidity(x, s=None):
-    value = np.sin(x * np.pi / 12) * 40 + 50 + np.random.normal(scale=2.5)
-    np.clip(value, 0,100, out=value)
-    return value
+    value = np.sin(x * np.pi / 12) * 40 + 50 + _noise(x, 2.5)
+    return np.clip(value, 0, 100)
 
 def co2(x, s=None):
-    value = 1000 + np.random.normal(scale=(np.sin(x) + 1) * 1000)
-    value = np.clip(value, 400, 5000, out=value)
-    return value
+    value = 1000 + np.random.normal(scale=(np.sin(x) + 1) * 1000, size=np.shape(x))
+    return np.clip(value, 400, 5000)
 
 def temp_sauna_parnaya(x, s=None):
-    if 19 < x < 21:
-        return  np.sin(x * np.pi - 3 * np.pi / 2) * 39 + 60 + np.random.normal(scale=0.1)
-    else:
-        return  20 + np.random.normal(scale=0.1)
+    hot = (19 < x) & (x < 21)
+    return np.where(hot, np.sin(x * np.pi - 3 * np.pi / 2) * 39 + 60, 20) + _noise(x, 0.1)
 
 def temp_sauna_predparnaya(x, s=None):
-    if 19 < x < 21:
-        return  np.sin(x * np.pi - 3 * np.pi / 2) * 10 + 30 + np.random.normal(scale=0.1)
-    else:
-        return  20 + np.random.normal(scale=0.1)
+    hot = (19 < x) & (x < 21)
+    return np.where(hot, np.sin(x * np.pi - 3 * np.pi / 2) * 10 + 30, 20) + _noise(x, 0.1)
 
 def temp_sauna_pipe(x, s=None):
-    if 19 < x < 23:
-        return np.sin(x * np.pi / 2 - 2 * np.pi) * 200 + 220 + np.random.normal(scale=0.1)
-    else:
-        return 20 + np.random.normal(scale=0.1)
+    hot = (19 < x) & (x < 23)
+    return np.where(hot, np.sin(x * np.pi / 2 - 2 * np.pi) * 200 + 220, 20) + _noise(x, 0.1)
 
 def co2_sauna(x, s=None):
-    if 19 < x < 21:
-        return  np.clip(np.sin(x * np.pi - 3 * np.pi / 2) * 125 + 125 + np.random.normal(scale=30), 0, 500)
-    else:
-        return  5 + np.random.normal(scale=0.1)
-
-def woodshed_weight(x, s):
-    rec = influx.latest_reading(s.id)
-    now = djtz.now()
-
-    if rec is None:
-        dt_hours = max((s.sampling_s or 1) / 3600.0, 0.0)
-        base_val = None
-    else:
-        rec_ts, rec_val = rec
-        dt_hours = (now - rec_ts).total_seconds() / 3600.0
-        if dt_hours < 0:
-            dt_hours = 0.0
-        dt_hours = max(dt_hours, (s.sampling_s or 1) / 3600.0)
-        base_val = rec_val
-
-    if base_val is None or (isinstance(base_val, float) and np.isnan(base_val)) or base_val == 0:
-        return float(np.clip(3000.0 - np.random.uniform(0, 10), 0, 3000))
-
-    dec = np.random.uniform(0, 2) * dt_hours
-    return float(np.clip(float(base_val) - dec, 0, 3000))
-
-
-def humidity_ground(x, s):
-    rec = influx.latest_reading(s.id)
-    now = djtz.now()
-
-    if rec is None:
-        dt_hours = max((s.sampling_s or 1) / 3600.0, 0.0)
-        base_val = None
-    else:
-        rec_ts, rec_val = rec
-        dt_hours = (now - rec_ts).total_seconds() / 3600.0
-        if dt_hours < 0:
-            dt_hours = 0.0
-        dt_hours = max(dt_hours, (s.sampling_s or 1) / 3600.0)
-        base_val = rec_val
-
-    if base_val is None or (isinstance(base_val, float) and np.isnan(base_val)) or base_val == 0:
-        return float(np.clip(100.0 - np.random.uniform(0, 10), 0, 100))
-
-    dec = np.random.uniform(8, 10) * dt_hours
-    return float(np.clip(float(base_val) - dec, 0, 100))
+    hot = (19 < x) & (x < 21)
+    burning = np.clip(np.sin(x * np.pi - 3 * np.pi / 2) * 125 + 125 + _noise(x, 30), 0, 500)
+    return np.where(hot, burning, 5 + _noise(x, 0.1))
+
+class Depleting:
+    """
+    Запас, который расходуется со случайной скоростью rate (единиц в час)
+    и пополняется почти до full, когда кончился: дрова, влага в почве.
+    Значение зависит от предыдущего, поэтому у генератора есть состояние:
+    state = {sensor_id: (epoch-секунды, значение)} — в памяти процесса,
+    заводится один раз (seed_generator_state / --state-file), а не
+    читается из InfluxDB на каждом тике.
+    """
+
+    def __init__(self, name: str, full: float, rate: Tuple[float, float]):
+        self.__name__ = name
+        self.full = full
+        self.rate = rate
+        self.state: Dict[int, Tuple[float, float]] = {}
+
+    def refill(self) -> float:
+        return float(np.clip(self.full - np.random.uniform(0, 10), 0, self.full))
+
+    def step(self, prev, dt_hours: float) -> float:
+        """Следующее значение после prev через dt_hours часов."""
+        if prev is None or np.isnan(prev) or prev == 0:
+            return self.refill()
+        dec = np.random.uniform(*self.rate) * dt_hours
+        return float(np.clip(float(prev) - dec, 0, self.full))
+
+    def series(self, n: int, dt_hours: float, prev=None) -> np.ndarray:
+        """
+        n значений подряд с шагом dt_hours начиная от prev: расход — одним
+        cumsum на весь отрезок до опустошения, затем пополнение и снова.
+        """
+        out = np.empty(n)
+        dec = np.random.uniform(*self.rate, size=n) * dt_hours
+        i, level = 0, prev
+        while i < n:
+            if level is None or np.isnan(level) or level <= 0:
+                level = out[i] = self.refill()
+                i += 1
+                continue
+            run = level - np.cumsum(dec[i:])
+            empty = np.flatnonzero(run <= 0)
+            stop = empty[0] + 1 if empty.size else n - i
+            out[i:i + stop] = np.clip(run[:stop], 0, self.full)
+            level = out[i + stop - 1]
+            i += stop
+        return out
+
+    def __call__(self, x, s):
+        now_s = time.time()
+        min_dt = (s.sampling_s or 1) / 3600.0
+
+        rec = self.state.get(s.id)
+        if rec is None:
+            value = self.step(None, min_dt)
+        else:
+            rec_ts, rec_val = rec
+            value = self.step(rec_val, max((now_s - rec_ts) / 3600.0, min_dt))
+        self.state[s.id] = (now_s, value)
+        return value
+
+woodshed_weight = Depleting("woodshed_weight", full=3000.0, rate=(0, 2))
+
+humidity_ground = Depleting("humidity_ground", full=100.0, rate=(8, 10))
 
 
 def water_level_pool(x, s=None):
-    return (s.min_val + s.max_val) / 2 + np.random.normal(scale=50)
+    return (s.min_val + s.max_val) / 2 + _noise(x, 50)
 
 def water_level_zero(x, s=None):
-    return 0
+    return np.zeros(np.shape(x))
 
 def greenhouse_temperature(x, s=None):
-    return np.sin(x * np.pi / 12 - np.pi / 2) * 10.0 + 20.0 + np.random.normal(scale=1/50)
+    return np.sin(x * np.pi / 12 - np.pi / 2) * 10.0 + 20.0 + _noise(x, 1/50)
 
 def outside_temperature(x, s=None):
-    return np.sin(x * np.pi / 12 - np.pi / 2) * 10.0 + 15.0 + np.random.normal(scale=1/50)
+    return np.sin(x * np.pi / 12 - np.pi / 2) * 10.0 + 15.0 + _noise(x, 1/50)
 
 def pool_temperature(x, s=None):
-    return np.sin(x * np.pi / 12 + 14 * np.pi / 12) * 10.0 + 15.0 + np.random.normal(scale=1/50)
+    return np.sin(x * np.pi / 12 + 14 * np.pi / 12) * 10.0 + 15.0 + _noise(x, 1/50)
 
 def garage_temperature(x, s=None):
-    return np.sin(x * np.pi / 12 + 4 * np.pi / 3) * 7.0 + 15.0 + np.random.normal(scale=1/50)
+    return np.sin(x * np.pi / 12 + 4 * np.pi / 3) * 7.0 + 15.0 + _noise(x, 1/50)
 
 def cellar_temperature(x, s=None):
-    return np.sin(x * np.pi / 12 + 4 * np.pi / 3) * 2 + 4 + np.random.normal(scale=1 / 50)
+    return np.sin(x * np.pi / 12 + 4 * np.pi / 3) * 2 + 4 + _noise(x, 1 / 50)
 
 def illumination(x, s=None):
-    return np.sin(x * np.pi / 12 - np.pi / 2) * 1250.0 + 1300 + np.random.normal(scale=1/50)
+    return np.sin(x * np.pi / 12 - np.pi / 2) * 1250.0 + 1300 + _noise(x, 1/50)
+
+# Генераторы с состоянием: им нужно прошлое значение датчика, поэтому они
+# считают по одному датчику и в пакетном режиме вызываются поштучно.
+STATEFUL_GENERATORS = {woodshed_weight, humidity_ground}
+
+def load_generator_state(path: str) -> int:
+    """Поднять состояние генераторов из файла-чекпоинта; вернёт число датчиков."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return 0
+    except ValueError as e:
+        print(f"[WARN] Broken state file {path}: {e}. Ignored.")
+        return 0
+
+    loaded = 0
+    for func in STATEFUL_GENERATORS:
+        for sid, (ts, value) in data.get(func.__name__, {}).items():
+            func.state[int(sid)] = (float(ts), float(value))
+            loaded += 1
+    return loaded
+
+def save_generator_state(path: str):
+    """Записать состояние генераторов в файл (через временный — атомарно)."""
+    data = {func.__name__: {str(sid): list(rec) for sid, rec in func.state.items()}
+            for func in STATEFUL_GENERATORS}
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
 
 
 SimulatorRegistry: Dict[Union[Tuple[int, str], str, int], Callable[[float], float]] = {
@@ -202,29 +262,377 @@ def _sensor_key_candidates(s: Sensor) -> Iterable[Union[Tuple[int, str], str, in
 
     yield s.name
 
-def _value_for_sensor(s: Sensor, now) -> float:
-    x = _now_hours_local(now)
-
-    func = None
+def _resolve_generator(s: Sensor):
     for k in _sensor_key_candidates(s):
         func = SimulatorRegistry.get(k)
         if func:
-            break
+            return func
+    return None
+
+class SensorPlan:
+    """
+    Что симулятор знает о датчике: генератор (ищется в SimulatorRegistry один
+    раз при загрузке набора датчиков), границы, период и следующий срок
+    записи (epoch-с). В горячем цикле — ни форматирования строк, ни поиска
+    по реестру.
+    """
+    __slots__ = ("sensor", "id", "label", "func", "lo", "hi", "period", "next_due")
+
+    def __init__(self, s: Sensor, next_due: float = 0.0):
+        self.sensor = s
+        self.id = s.id
+        self.label = str(s)
+        self.func = _resolve_generator(s)
+        self.lo = s.min_val
+        self.hi = s.max_val
+        self.period = max(1, s.sampling_s or 1)
+        self.next_due = next_due
+
+    def value(self, x: float) -> float:
+        if self.func:
+            try:
+                val = float(self.func(x, self.sensor))
+            except Exception as e:
+                print(f"[WARN] Failed for '{self.label}' (ID={self.id}): {e}. Fallback to rand value.")
+                val = _pick_random(self.sensor)
+        else:
+            val = _pick_random(self.sensor)
+
+        if self.lo is not None:
+            val = max(val, self.lo)
+        if self.hi is not None:
+            val = min(val, self.hi)
+        return val
+
+def build_plans(sensors, prev=None) -> list[SensorPlan]:
+    """Планы для набора датчиков; сроки уже известных берутся из прежних планов prev."""
+    due = {p.id: p.next_due for p in prev or ()}
+    return [SensorPlan(s, due.get(s.id, 0.0)) for s in sensors]
+
+def seed_generator_state(plans) -> int:
+    """
+    Завести состояние датчикам генераторов с состоянием, у которых его ещё
+    нет: последние значения — одним запросом latest_readings на всех.
+    Вернёт, скольким датчикам нашлось значение.
+    """
+    missing: Dict[int, Tuple[Depleting, int]] = {}
+    for p in plans:
+        if p.func in STATEFUL_GENERATORS and p.id not in p.func.state:
+            missing[p.id] = (p.func, p.period)
+    if not missing:
+        return 0
+
+    latest = influx.latest_readings(missing, {sid: sampling for sid, (_, sampling) in missing.items()})
+    for sid, (ts, value) in latest.items():
+        missing[sid][0].state[sid] = (ts.timestamp(), float(value))
+    return len(latest)
+
+# ===== Пакетный режим (--batch) =====
+
+def _active_sensors(shard: Tuple[int, int] | None = None):
+    """Активные датчики; shard=(k, n) — только те, у кого id % n == k."""
+    qs = Sensor.objects.filter(is_active=True)
+    if shard is not None:
+        k, n = shard
+        qs = qs.alias(shard=F("id") % n).filter(shard=k)
+    return list(
+        qs.select_related("facility")
+        .only("id", "sampling_s", "min_val", "max_val", "name", "facility")
+    )
+
+def _active_fingerprint() -> str:
+    """
+    Отпечаток набора активных датчиков: md5 всех полей, которые важны
+    симулятору (генератор ищется и по имени датчика и постройки, см.
+    _sensor_key_candidates), по порядку id. Суммы и updated_at не годятся:
+    разные наборы дают равные суммы, а updated_at при переименовании не меняется.
+    """
+    rows = (Sensor.objects.filter(is_active=True).order_by("id")
+            .values_list("id", "name", "facility_id", "facility__name", "facility__type",
+                         "sampling_s", "min_val", "max_val"))
+    return hashlib.md5(repr(list(rows)).encode(), usedforsecurity=False).hexdigest()
+
+def _bound(v) -> float:
+    return np.nan if v is None else float(v)
+
+class SensorBatch:
+    """Группа датчиков одного генератора: поля датчиков — массивами NumPy."""
+
+    def __init__(self, sensors, last=None):
+        self.sensors = sensors
+        self.id = np.array([s.id for s in sensors], dtype=np.int64)
+        self.sampling_s = np.array([max(1, s.sampling_s or 1) for s in sensors], dtype=float)
+        self.min_val = np.array([_bound(s.min_val) for s in sensors], dtype=float)
+        self.max_val = np.array([_bound(s.max_val) for s in sensors], dtype=float)
+        # когда писали последний раз, epoch-секунды
+        last = last or {}
+        self.last = np.array([last.get(s.id, -np.inf) for s in sensors], dtype=float)
+
+    def __len__(self):
+        return len(self.sensors)
+
+    def subset(self, idx) -> "SensorBatch":
+        part = SensorBatch.__new__(SensorBatch)
+        part.sensors = [self.sensors[i] for i in idx]
+        for field in ("id", "sampling_s", "min_val", "max_val", "last"):
+            setattr(part, field, getattr(self, field)[idx])
+        return part
+
+def _pick_random_batch(batch: SensorBatch) -> np.ndarray:
+    lo, hi = batch.min_val, batch.max_val
+    bounded = ~np.isnan(lo) & ~np.isnan(hi)
+    mid = np.where(bounded, (lo + hi) / 2, 50.0)
+    scale = np.where(bounded, np.abs(lo + hi) / 8, 10.0)
+    return np.where(bounded, np.clip(np.random.normal(mid, scale), lo, hi), np.random.normal(mid, scale))
+
+def _values_for_batch(func, x: float, batch: SensorBatch) -> np.ndarray:
+    if func is None:
+        values = _pick_random_batch(batch)
+    elif func in STATEFUL_GENERATORS:
+        values = np.array([_value_for_stateful(func, x, s) for s in batch.sensors], dtype=float)
+    else:
+        try:
+            values = np.broadcast_to(np.asarray(func(np.full(len(batch), x), batch), dtype=float),
+                                     (len(batch),)).copy()
+        except Exception as e:
+            print(f"[WARN] Failed for {func.__name__} ({len(batch)} sensors): {e}. Fallback to rand value.")
+            values = _pick_random_batch(batch)
+
+    bad = ~np.isfinite(values)
+    if bad.any():
+        values[bad] = _pick_random_batch(batch)[bad]
+    # np.fmax/fmin игнорируют NaN — так датчики без границ не клипаются
+    return np.fmin(np.fmax(values, batch.min_val), batch.max_val)
+
+def _value_for_stateful(func, x: float, s: Sensor) -> float:
+    try:
+        return float(func(x, s))
+    except Exception as e:
+        print(f"[WARN] Failed for '{s}' (ID={s.id}): {e}. Fallback to rand value.")
+        return float(_pick_random(s))
+
+class BatchSimulator:
+    """
+    Пакетный симулятор: датчики сгруппированы по генератору из их планов
+    (SensorPlan), за тик каждая группа считает значения
+    всех своих «созревших» датчиков одним вызовом над массивом, а все
+    точки тика уходят в InfluxDB одним запросом line protocol.
+    """
+
+    def __init__(self, plans, last=None):
+        groups: Dict[Callable, list] = {}
+        for p in plans:
+            groups.setdefault(p.func, []).append(p.sensor)
+        self.groups = [(func, SensorBatch(members, last)) for func, members in groups.items()]
+        self.size = len(plans)
+
+    def last_written(self) -> Dict[int, float]:
+        last = {}
+        for _, batch in self.groups:
+            last.update(zip(batch.id.tolist(), batch.last.tolist()))
+        return last
+
+    def tick(self, now, sync: bool = True) -> int:
+        now_s = now.timestamp()
+        ts_ns = int(now_s) * 1_000_000_000 + now.microsecond * 1_000
+        x = _now_hours_local(now)
+
+        ids, values = [], []
+        for func, batch in self.groups:
+            due = np.flatnonzero(now_s - batch.last >= batch.sampling_s)
+            if not due.size:
+                continue
+            part = batch.subset(due)
+            values.append(_values_for_batch(func, x, part))
+            ids.append(part.id)
+            batch.last[due] = now_s
+
+        if not ids:
+            return 0
+        ids, values = np.concatenate(ids), np.concatenate(values)
+        return influx.write_readings(zip(ids.tolist(), itertools.repeat(ts_ns), values.tolist()), sync=sync)
+
+def _reload_batch(sim, fingerprint, shard=None):
+    """
+    Пересобрать BatchSimulator, если изменился набор активных датчиков
+    (сохранив, кому когда писали). Вернёт (sim, fingerprint).
+    """
+    fp = _active_fingerprint()
+    if sim is not None and fp == fingerprint:
+        return sim, fingerprint
+    plans = build_plans(_active_sensors(shard))
+    seed_generator_state(plans)
+    return BatchSimulator(plans, last=sim.last_written() if sim else None), fp
+
+
+# ===== Расписание на куче (--scheduler heap) =====
+
+class HeapScheduler:
+    """
+    Планировщик по абсолютному времени: в min-куче лежат (срок, датчик),
+    цикл asyncio спит ровно до ближайшего срока, снимает с кучи всё, что
+    созрело, считает группы по генератору над массивом и пишет одним
+    запросом. Следующий срок — прошлый срок + sampling_s (а не «сейчас» +
+    sampling_s), поэтому расписание не уплывает; меткой точки служит её
+    срок. Работа пропорциональна числу показаний, а не датчикам × тикам.
+    Первые сроки выровнены на кратное sampling_s — датчики с одним периодом
+    пишутся вместе.
+    """
+
+    def __init__(self, plans, due: Dict[int, float] | None = None, start: float | None = None):
+        self.sim = BatchSimulator(plans)
+        self.size = self.sim.size
+        flat = [(g, i) for g, (_, batch) in enumerate(self.sim.groups) for i in range(len(batch))]
+        self.group_of = np.array([g for g, _ in flat], dtype=np.int64)
+        self.pos_of = np.array([i for _, i in flat], dtype=np.int64)
+        self.ids = [int(self.sim.groups[g][1].id[i]) for g, i in flat]
+        self.period = [float(self.sim.groups[g][1].sampling_s[i]) for g, i in flat]
+
+        now, due = time.time(), due or {}
+        self.heap = []
+        for idx, (sid, period) in enumerate(zip(self.ids, self.period)):
+            first = start if start is not None else math.ceil(now / period) * period
+            self.heap.append((due.get(sid, first), idx))
+        heapq.heapify(self.heap)
+        self.lateness: list[float] = []
+
+    def next_due(self) -> float | None:
+        return self.heap[0][0] if self.heap else None
+
+    def due_map(self) -> Dict[int, float]:
+        return {self.ids[idx]: due for due, idx in self.heap}
+
+    def run_due(self, now: float) -> int:
+        """Снять с кучи и записать всё, что созрело к now (epoch-с); вернёт число точек."""
+        heap, by_due = self.heap, {}
+        while heap and heap[0][0] <= now:
+            due, idx = heapq.heappop(heap)
+            by_due.setdefault(due, []).append(idx)
+            self.lateness.append(now - due)
+            # пропущенные сроки не догоняем: следующий — первый после now
+            period = self.period[idx]
+            heapq.heappush(heap, (due + (math.floor((now - due) / period) + 1) * period, idx))
+
+        ids, stamps, values = [], [], []
+        for due, idxs in by_due.items():
+            idxs = np.array(idxs, dtype=np.int64)
+            x = _now_hours_local(datetime.fromtimestamp(due, tz=timezone.utc))
+            groups = self.group_of[idxs]
+            for g in np.unique(groups):
+                func, batch = self.sim.groups[g]
+                part = batch.subset(self.pos_of[idxs[groups == g]])
+                ids.append(part.id)
+                values.append(_values_for_batch(func, x, part))
+                stamps.append(np.full(len(part), round(due * 1e9), dtype=np.int64))
+        if not ids:
+            return 0
+        ids, stamps, values = np.concatenate(ids), np.concatenate(stamps), np.concatenate(values)
+        return influx.write_readings(zip(ids.tolist(), stamps.tolist(), values.tolist()))
+
+    def lateness_stats(self) -> Tuple[int, float, float, float]:
+        """(точек, среднее, p99, максимум опоздания в секундах) с прошлого вызова."""
+        late, self.lateness = np.array(self.lateness), []
+        if not late.size:
+            return 0, 0.0, 0.0, 0.0
+        return late.size, float(late.mean()), float(np.percentile(late, 99)), float(late.max())
+
+
+# ===== Несколько процессов (--workers N) =====
+
+def _generator_state() -> dict:
+    return {func.__name__: dict(func.state) for func in STATEFUL_GENERATORS}
+
+def _worker(shard: Tuple[int, int], tick: float, once: bool, refresh: float,
+            stats, stop, send_state: bool):
+    """
+    Процесс-шард: датчики с id % n == k, свой пакетный писатель InfluxDB
+    (клиент создаётся заново в каждом процессе). Тики идут по расписанию
+    от старта, а не sleep(tick) после работы, поэтому не уплывают; в stats
+    уходит ("tick", опоздание тика в секундах, число точек) и, если нужен
+    чекпоинт, ("state", состояние генераторов).
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # остановка — через stop от главного процесса
+    k, n = shard
+    sim, fingerprint, checked, state_sent = None, None, 0.0, time.monotonic()
+    deadline = time.monotonic()
+    try:
+        while not stop.is_set():
+            started = time.monotonic()
+            if sim is None or started - checked >= refresh:
+                checked = started
+                prev, (sim, fingerprint) = sim, _reload_batch(sim, fingerprint, shard)
+                if sim is not prev:
+                    print(f"[worker {k}/{n}] loaded {sim.size} sensors in {len(sim.groups)} generator groups",
+                          flush=True)
+
+            written = sim.tick(djtz.now(), sync=False)
+            stats.put(("tick", started - deadline, written))
+            if send_state and (once or time.monotonic() - state_sent >= refresh):
+                stats.put(("state", _generator_state()))
+                state_sent = time.monotonic()
 
-    if func:
+            if once:
+                break
+            # отставшие тики не догоняем: следующий — по расписанию или сразу
+            deadline = max(deadline + tick, time.monotonic())
+            stop.wait(deadline - time.monotonic())
+    finally:
+        if send_state:
+            stats.put(("state", _generator_state()))
+        influx.close()   # дописать то, что осталось в буфере писателя
+
+
+# ===== Заливка истории (--backfill-from/--backfill-to) =====
+
+def _parse_when(value: str) -> datetime:
+    dt = parse_datetime(value)
+    if dt is None:
+        d = parse_date(value)
+        if d is None:
+            raise CommandError(f"Не понимаю дату/время: {value!r}")
+        dt = datetime.combine(d, datetime.min.time())
+    return djtz.make_aware(dt) if djtz.is_naive(dt) else dt
+
+def _hours_local(ts_ns: np.ndarray) -> np.ndarray:
+    """
+    Час местных суток для каждой метки (нс). Смещение зоны берётся по первой
+    метке куска — переход на летнее время внутри куска не учитывается.
+    """
+    first = datetime.fromtimestamp(int(ts_ns[0]) // 1_000_000_000, tz=timezone.utc)
+    offset_s = djtz.localtime(first).utcoffset().total_seconds()
+    secs = (ts_ns // 1_000_000_000 + offset_s) % 86400 + (ts_ns % 1_000_000_000) / 1e9
+    return secs / 3600.0
+
+def _pick_random_series(s: Sensor, n: int) -> np.ndarray:
+    if s.min_val is not None and s.max_val is not None:
+        return np.clip(np.random.normal((s.min_val + s.max_val) / 2, abs(s.min_val + s.max_val) / 8, n),
+                       s.min_val, s.max_val)
+    return np.random.normal(50.0, 10.0, n)
+
+def _backfill_values(func, s: Sensor, ts_ns: np.ndarray) -> np.ndarray:
+    """
+    Значения датчика сразу на весь кусок сетки ts_ns. Генераторы с
+    состоянием продолжают со своего состояния в памяти и оставляют в нём
+    последнюю точку куска.
+    """
+    n = len(ts_ns)
+    if func in STATEFUL_GENERATORS:
+        rec = func.state.get(s.id)
+        values = func.series(n, max(1, s.sampling_s or 1) / 3600.0, rec[1] if rec else None)
+        func.state[s.id] = (int(ts_ns[-1]) / 1e9, float(values[-1]))
+    elif func is None:
+        values = _pick_random_series(s, n)
+    else:
         try:
-            val = float(func(x, s))
+            values = np.broadcast_to(np.asarray(func(_hours_local(ts_ns), s), dtype=float), (n,)).copy()
         except Exception as e:
             print(f"[WARN] Failed for '{s}' (ID={s.id}): {e}. Fallback to rand value.")
-            val = _pick_random(s)
-    else:
-        val = _pick_random(s)
+            values = _pick_random_series(s, n)
 
-    if s.min_val is not None:
-        val = max(val, s.min_val)
-    if s.max_val is not None:
-        val = min(val, s.max_val)
-    return val
+    bad = ~np.isfinite(values)
+    if bad.any():
+        values[bad] = _pick_random_series(s, int(bad.sum()))
+    return np.fmin(np.fmax(values, _bound(s.min_val)), _bound(s.max_val))
 
 
 class Command(BaseCommand):
@@ -235,36 +643,250 @@ class Command(BaseCommand):
                             help="Шаг цикла в секундах (по умолчанию 1.0)")
         parser.add_argument("--once", action="store_true",
                             help="Сделать один проход по активным датчикам и выйти")
+        parser.add_argument("--batch", action="store_true",
+                            help="Пакетный режим: значения группами по генератору, "
+                                 "все точки тика — одним запросом")
+        parser.add_argument("--scheduler", choices=("tick", "heap"), default="tick",
+                            help="tick — раз в --tick проверять все датчики; heap — пакетный "
+                                 "режим на asyncio: просыпаться ровно к сроку очередного датчика "
+                                 "по абсолютному расписанию sampling_s (--tick не нужен)")
+        parser.add_argument("--workers", type=int, default=0,
+                            help="Пакетный режим в N процессах: активные датчики делятся "
+                                 "по id % N, у каждого процесса свой писатель InfluxDB")
+        parser.add_argument("--refresh", type=float, default=30.0,
+                            help="Как часто проверять, не изменился ли "
+                                 "набор активных датчиков, в секундах (по умолчанию 30); "
+                                 "с тем же шагом сохраняется --state-file")
+        parser.add_argument("--state-file", metavar="ПУТЬ",
+                            help="Файл-чекпоинт состояния генераторов (запас дров, влага "
+                                 "почвы): читается при старте, пишется по ходу и при выходе, "
+                                 "чтобы после перезапуска ряды продолжались без скачков")
+        parser.add_argument("--backfill-from", metavar="ДАТА",
+                            help="Залить историю с этой даты/времени (ISO, местное время) "
+                                 "по сетке sampling_s каждого датчика и выйти")
+        parser.add_argument("--backfill-to", metavar="ДАТА",
+                            help="Конец заливаемой истории (по умолчанию — сейчас)")
+        parser.add_argument("--chunk", type=int, default=50_000,
+                            help="Сколько точек одного датчика отправлять одним запросом "
+                                 "при заливке истории (по умолчанию 50000)")
 
     def handle(self, *args, **opts):
+        self._state_file = opts["state_file"]
+        self._state_every = opts["refresh"]
+        self._state_saved = time.monotonic()
+        if self._state_file:
+            print(f"Loaded generator state for {load_generator_state(self._state_file)} sensors")
+        try:
+            self._run(opts)
+        finally:
+            self._save_state(force=True)
+
+    def _save_state(self, force: bool = False):
+        if not self._state_file:
+            return
+        if force or time.monotonic() - self._state_saved >= self._state_every:
+            save_generator_state(self._state_file)
+            self._state_saved = time.monotonic()
+
+    def _run(self, opts):
+        if opts["backfill_from"]:
+            start = _parse_when(opts["backfill_from"])
+            end = _parse_when(opts["backfill_to"]) if opts["backfill_to"] else djtz.now()
+            if end <= start:
+                raise CommandError("--backfill-to должен быть позже --backfill-from")
+            self._run_backfill(start, end, max(1, opts["chunk"]))
+            return
+
         tick = opts["tick"]
         once = opts["once"]
 
         self.stdout.write(self.style.SUCCESS(
-            f"Старт симулятора: tick={tick}s once={once}"
+            f"Старт симулятора: tick={tick}s once={once} batch={opts['batch']} "
+            f"workers={opts['workers']} scheduler={opts['scheduler']}"
         ))
 
+        if opts["scheduler"] == "heap":
+            asyncio.run(self._run_scheduled(once, opts["refresh"]))
+            return
+
+        if opts["workers"] > 0:
+            self._run_workers(opts["workers"], tick, once, opts["refresh"])
+            return
+
+        if opts["batch"]:
+            self._run_batch(tick, once, opts["refresh"])
+            return
+
+        refresh = opts["refresh"]
+        verbose = opts["verbosity"] >= 2   # строка на показание — только по -v 2
+        plans, fingerprint, checked = None, None, 0.0
         while True:
-            now = djtz.now()
+            started = time.monotonic()
+            if plans is None or started - checked >= refresh:
+                checked = started
+                fp = _active_fingerprint()
+                if fp != fingerprint:
+                    plans = build_plans(_active_sensors(), prev=plans)
+                    seed_generator_state(plans)
+                    fingerprint = fp
 
-            active = list(
-                Sensor.objects.filter(is_active=True)
-                .select_related("facility")
-                .only("id", "sampling_s", "min_val", "max_val", "name", "facility")
-            )
+            now = djtz.now()
+            now_s = now.timestamp()
+            x = _now_hours_local(now)
 
-            for s in active:
-                last = _last_written.get(s.id)
-                due = last is None or (now - last).total_seconds() >= max(1, s.sampling_s)
-                if not due:
+            written = 0
+            for p in plans:
+                if now_s < p.next_due:
                     continue
 
-                value = _value_for_sensor(s, now)
-                influx.write_reading(sensor_id=s.id, ts=now, value=value)
+                value = p.value(x)
+                influx.write_reading(sensor_id=p.id, ts=now, value=value)
+                written += 1
 
-                print(f"Writing to {s.id} '{s}' value={value:.6f}")
-                _last_written[s.id] = now
+                if verbose:
+                    print(f"Writing to {p.id} '{p.label}' value={value:.6f}")
+                p.next_due = now_s + p.period
+            if written:
+                elapsed = time.monotonic() - started
+                print(f"[{djtz.localtime(now):%H:%M:%S}] wrote {written} points in {elapsed * 1000:.0f} ms")
 
+            self._save_state()
             if once:
                 break
-            time.sleep(tick)
\ No newline at end of file
+            time.sleep(tick)
+
+    def _run_batch(self, tick: float, once: bool, refresh: float):
+        sim, fingerprint, checked = None, None, 0.0
+        while True:
+            started = time.monotonic()
+            if sim is None or started - checked >= refresh:
+                checked = started
+                prev, (sim, fingerprint) = sim, _reload_batch(sim, fingerprint)
+                if sim is not prev:
+                    print(f"Loaded {sim.size} active sensors in {len(sim.groups)} generator groups")
+
+            now = djtz.now()
+            written = sim.tick(now)
+            elapsed = time.monotonic() - started
+            if written:
+                print(f"[{djtz.localtime(now):%H:%M:%S}] wrote {written} points in {elapsed * 1000:.0f} ms")
+
+            self._save_state()
+            if once:
+                break
+            time.sleep(max(0.0, tick - elapsed))
+
+    async def _run_scheduled(self, once: bool, refresh: float):
+        """
+        Цикл HeapScheduler. ORM и запись (а за ней правила с их запросами к БД)
+        синхронные — они идут через sync_to_async, asyncio только ждёт сроков.
+        """
+        def reload(sched, fingerprint):
+            fp = _active_fingerprint()
+            if sched is not None and fp == fingerprint:
+                return sched, fingerprint
+            plans = build_plans(_active_sensors())
+            seed_generator_state(plans)
+            sched = HeapScheduler(plans, due=sched.due_map() if sched else None,
+                                  start=time.time() if once else None)
+            print(f"Scheduled {sched.size} active sensors in {len(sched.sim.groups)} generator groups")
+            return sched, fp
+
+        sched, fingerprint = await sync_to_async(reload)(None, None)
+        checked = reported = time.monotonic()
+        written = 0
+        while True:
+            if time.monotonic() - checked >= refresh:
+                sched, fingerprint = await sync_to_async(reload)(sched, fingerprint)
+                checked = time.monotonic()
+
+            next_due = sched.next_due()
+            wait = refresh if next_due is None else next_due - time.time()
+            wait = min(wait, checked + refresh - time.monotonic())
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            written += await sync_to_async(sched.run_due)(time.time())
+            self._save_state()
+            if once or time.monotonic() - reported >= 1.0:
+                n, avg, p99, worst = sched.lateness_stats()
+                print(f"[{djtz.localtime():%H:%M:%S}] wrote {written} points, lateness "
+                      f"avg {avg * 1000:.1f} ms p99 {p99 * 1000:.1f} ms max {worst * 1000:.1f} ms")
+                written, reported = 0, time.monotonic()
+            if once:
+                break
+
+    def _run_workers(self, n: int, tick: float, once: bool, refresh: float):
+        ctx = multiprocessing.get_context("fork")
+        stats, stop = ctx.Queue(), ctx.Event()
+        connections.close_all()   # соединения с БД не должны достаться детям по fork
+        workers = [
+            ctx.Process(target=_worker, name=f"simulate-{k}", daemon=True,
+                        args=((k, n), tick, once, refresh, stats, stop, bool(self._state_file)))
+            for k in range(n)
+        ]
+        for w in workers:
+            w.start()
+        try:
+            self._collect(workers, stats, n, tick)
+        except KeyboardInterrupt:
+            print("Stopping workers...")
+            stop.set()
+            self._collect(workers, stats, n, tick)
+        for w in workers:
+            w.join()
+
+    def _collect(self, workers, stats, n: int, tick: float):
+        """
+        Читать статистику процессов, пока они живы, и раз в тик (не чаще раза
+        в секунду) печатать точки/с и опоздание тиков.
+        """
+        period = max(tick, 1.0)
+        points, lags, since = 0, [], time.monotonic()
+
+        def report():
+            elapsed = time.monotonic() - since
+            print(f"[{djtz.localtime():%H:%M:%S}] {n} workers: {points / elapsed:.0f} points/s, "
+                  f"lag avg {sum(lags) / len(lags) * 1000:.0f} ms max {max(lags) * 1000:.0f} ms")
+
+        while any(w.is_alive() for w in workers) or not stats.empty():
+            try:
+                kind, *payload = stats.get(timeout=0.2)
+            except queue.Empty:
+                kind = None
+            if kind == "tick":
+                lags.append(payload[0])
+                points += payload[1]
+            elif kind == "state":
+                for func in STATEFUL_GENERATORS:
+                    func.state.update(payload[0].get(func.__name__, {}))
+                self._save_state()
+
+            if lags and time.monotonic() - since >= period:
+                report()
+                points, lags, since = 0, [], time.monotonic()
+        if lags:
+            report()
+
+    def _run_backfill(self, start: datetime, end: datetime, chunk: int):
+        self.stdout.write(self.style.SUCCESS(
+            f"Заливка истории: {djtz.localtime(start)} — {djtz.localtime(end)}, chunk={chunk}"
+        ))
+        start_ns = influx._ts_ns(start)
+        end_ns = influx._ts_ns(end)
+        total, started = 0, time.monotonic()
+
+        for p in build_plans(_active_sensors()):
+            s, func = p.sensor, p.func
+            step_ns = p.period * 1_000_000_000
+            n = -(-(end_ns - start_ns) // step_ns)
+            written = 0
+            for i0 in range(0, n, chunk):
+                ts_ns = start_ns + np.arange(i0, min(n, i0 + chunk), dtype=np.int64) * step_ns
+                written += influx.write_series(s.id, ts_ns, _backfill_values(func, s, ts_ns))
+            total += written
+            print(f"Backfilled {s.id} '{s}': {written} points")
+
+        elapsed = time.monotonic() - started
+        print(f"Done: {total} points in {elapsed:.1f} s ({total / max(elapsed, 1e-9):.0f} points/s)")
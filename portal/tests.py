@@ -1,3 +1,35 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from accounts.models import User
+from core.models import Facility, Sensor
+from portal.management.commands.simulate_readings import _active_fingerprint
+
+
+class LiveTests(SimpleTestCase):
+    def test_wsgi_answers_501_to_any_method(self):
+        # по HEAD дашборд узнаёт, что переподключаться к SSE незачем
+        for method in ("get", "head"):
+            with self.subTest(method=method):
+                response = getattr(self.client, method)(reverse("portal:api_live"))
+                self.assertEqual(response.status_code, 501)
+
+
+class ActiveFingerprintTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username="u")
+        facility = Facility.objects.create(name="Дом", type="house")
+        self.a = Sensor.objects.create(user=user, facility=facility, name="t", sampling_s=10, is_active=True)
+        self.b = Sensor.objects.create(user=user, facility=facility, name="h", sampling_s=20, is_active=True)
+
+    def test_changes_on_rename(self):
+        before = _active_fingerprint()
+        Sensor.objects.filter(pk=self.a.pk).update(name="t2")
+        self.assertNotEqual(_active_fingerprint(), before)
+
+    def test_changes_when_sums_stay_equal(self):
+        before = _active_fingerprint()
+        # суммы sampling_s те же, но у датчиков поменялись периоды
+        Sensor.objects.filter(pk=self.a.pk).update(sampling_s=20)
+        Sensor.objects.filter(pk=self.b.pk).update(sampling_s=10)
+        self.assertNotEqual(_active_fingerprint(), before)
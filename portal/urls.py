@@ -34,6 +34,10 @@ urlpatterns = [
     path("alerts/<int:pk>/edit/", views.AlertUpdateView.as_view(), name="alerts_edit"),
     path("alerts/<int:pk>/delete/", views.AlertDeleteView.as_view(), name="alerts_delete"),
 
+    path("api/ingest/", views.api_ingest, name="api_ingest"),
+    path("api/live/", views.api_live, name="api_live"),
     path("api/sensors/", views.api_sensors, name="api_sensors"),
+    path("api/sensors/latest/", views.api_sensors_latest, name="api_sensors_latest"),
+    path("api/sensors/series/", views.api_sensors_series, name="api_sensors_series"),
     path("api/sensors/<int:sensor_id>/series/", views.api_sensor_series, name="api_sensor_series"),
 ]
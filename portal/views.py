@@ -1,17 +1,28 @@
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout, get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
-from django.http import JsonResponse
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
+from django.template.response import TemplateResponse
 from django.urls import reverse_lazy
+from django.utils.functional import cached_property
 from django.views import View
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 
 from core.models import Sensor, Actuator, Facility, Rule, Alert
-from core import influx
-from django.views.decorators.http import require_GET
+from core import influx, ingest, live, metrics, versions
+from core.stats import dashboard_stats
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+import hashlib
+import hmac
 import logging
+import numpy as np
 
 from portal.forms import AlertForm
 
@@ -53,30 +64,64 @@ def dashboard(request):
         .order_by('-started_at')[:10]
     )
 
-    active_sensors = list(
-        Sensor.objects.filter(is_active=True)
-        .select_related('facility', 'unit')
-        .values('id', 'name', 'facility__name', 'unit__code')
-        .order_by('facility__name', 'name')
-    )
-
+    stats = dashboard_stats()
     ctx = {
-        "sensors_active_count" : f"{Sensor.objects.filter(is_active=True).count()}/{Sensor.objects.count()}",
-        "sensors_count": Sensor.objects.count(),
-        "actuators_active_count": f"{Actuator.objects.filter(is_active=True).count()}/{Actuator.objects.count()}",
-        "actuators_count": Actuator.objects.count(),
-        "facilities_count": Facility.objects.count(),
-        "rules_count": Rule.objects.count(),
+        "sensors_active_count": f"{stats['sensors_active']}/{stats['sensors_total']}",
+        "sensors_count": stats["sensors_total"],
+        "actuators_active_count": f"{stats['actuators_active']}/{stats['actuators_total']}",
+        "actuators_count": stats["actuators_total"],
+        "facilities_count": stats["facilities"],
+        "rules_count": stats["rules"],
         "alerts_recent": alerts_recent,
-        'active_sensors': active_sensors,
+        'active_sensors': stats["active_sensors"],
     }
-    return render(request, "portal/dashboard.html", ctx)
+    return TemplateResponse(request, "portal/dashboard.html", ctx)
+
+class VersionedCountPaginator(Paginator):
+    """Paginator, у которого число строк берётся из кэша под версией таблиц."""
+
+    def __init__(self, *args, version: str = "", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = version
+
+    @cached_property
+    def count(self):
+        query = hashlib.md5(str(self.object_list.query).encode()).hexdigest()
+        return cache.get_or_set(f"count:{query}:{self.version}", lambda: Paginator.count.func(self),
+                                timeout=settings.LIST_CACHE_TIMEOUT)
+
+
+class CachedListMixin:
+    """
+    Списки, которые редко меняются. Число строк и таблица страницы
+    ({% cache cache_timeout "<имя>" cache_version page_obj.number %} в
+    шаблоне) кэшируются под версией таблиц cache_models (core.versions),
+    поэтому тёплая страница в БД не ходит: срез queryset ленивый, а
+    читается только внутри промахнувшегося фрагмента.
+    """
+    cache_models: tuple[str, ...] = ()
+
+    @cached_property
+    def cache_version(self) -> str:
+        return versions.get(*self.cache_models)
 
-class SensorListView(LoginRequiredMixin, ListView):
+    def get_paginator(self, queryset, per_page, **kwargs):
+        return VersionedCountPaginator(queryset, per_page, version=self.cache_version, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx["cache_version"] = self.cache_version
+        ctx["cache_timeout"] = settings.LIST_CACHE_TIMEOUT
+        return ctx
+
+
+class SensorListView(LoginRequiredMixin, CachedListMixin, ListView):
     model = Sensor
+    queryset = Sensor.objects.select_related("facility", "unit")
     template_name = "portal/sensors_list.html"
     paginate_by = 20
     ordering = ["facility__name", "name"]
+    cache_models = ("core.sensor", "core.facility", "core.unit")
 
 class SensorCreateView(LoginRequiredMixin, CreateView):
     model = Sensor
@@ -109,11 +154,13 @@ class SensorDeleteView(LoginRequiredMixin, DeleteView):
     template_name = "portal/confirm_delete.html"
     success_url = reverse_lazy("portal:sensors_list")
 
-class ActuatorListView(LoginRequiredMixin, ListView):
+class ActuatorListView(LoginRequiredMixin, CachedListMixin, ListView):
     model = Actuator
+    queryset = Actuator.objects.select_related("facility")
     template_name = "portal/actuators_list.html"
     paginate_by = 40
     ordering = ["facility__name", "name"]
+    cache_models = ("core.actuator", "core.facility")
 
 class ActuatorCreateView(LoginRequiredMixin, CreateView):
     model = Actuator
@@ -143,11 +190,12 @@ class ActuatorDeleteView(LoginRequiredMixin, DeleteView):
     template_name = "portal/confirm_delete.html"
     success_url = reverse_lazy("portal:actuators_list")
 
-class FacilityListView(LoginRequiredMixin, ListView):
+class FacilityListView(LoginRequiredMixin, CachedListMixin, ListView):
     model = Facility
     template_name = "portal/facilities_list.html"
     paginate_by = 20
     ordering = ["name"]
+    cache_models = ("core.facility",)
 
 class FacilityCreateView(LoginRequiredMixin, CreateView):
     model = Facility
@@ -176,11 +224,12 @@ class FacilityDeleteView(LoginRequiredMixin, DeleteView):
     template_name = "portal/confirm_delete.html"
     success_url = reverse_lazy("portal:facilities_list")
 
-class RuleListView(LoginRequiredMixin, ListView):
+class RuleListView(LoginRequiredMixin, CachedListMixin, ListView):
     model = Rule
     template_name = "portal/rules_list.html"
     paginate_by = 20
     ordering = ["-created_at"]
+    cache_models = ("core.rule",)
 
 class RuleCreateView(LoginRequiredMixin, CreateView):
     model = Rule
@@ -242,29 +291,248 @@ class AlertDeleteView(DeleteView):
 
 
 def api_sensors(request):
-    data = list(Sensor.objects.filter(is_active=True)
-                .order_by("facility__name","name")
-                .values("id","name","facility__name"))
-    return JsonResponse({"sensors": data})
+    key = f"api_sensors:{versions.get('core.sensor', 'core.facility')}"
+    data = cache.get(key)
+    if data is None:
+        data = list(Sensor.objects.filter(is_active=True)
+                    .order_by("facility__name","name")
+                    .values("id","name","facility__name"))
+        cache.set(key, data, timeout=settings.LIST_CACHE_TIMEOUT)
+    with metrics.timed("serialize"):
+        return JsonResponse({"sensors": data})
 
 
 @require_GET
-def api_sensor_series(request, sensor_id: int):
+def api_sensors_latest(request):
+    """
+    Текущие значения датчиков одним запросом: ?ids=1,2,3, по умолчанию —
+    все активные. {"latest": {"<id>": {"t": <мс>, "v": <значение>}}}.
+    """
+    try:
+        ids = [int(i) for i in request.GET.get("ids", "").split(",") if i.strip()]
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    sensors = Sensor.objects.filter(is_active=True) if not ids else Sensor.objects.filter(id__in=ids)
+    sampling = dict(sensors.values_list("id", "sampling_s"))
+    latest = influx.latest_readings(ids or sampling, sampling_s=sampling)
+    with metrics.timed("serialize"):
+        return JsonResponse({
+            "latest": {
+                str(sid): {"t": int(ts.timestamp() * 1000), "v": v}
+                for sid, (ts, v) in latest.items()
+            },
+        })
+
+
+def _series_json(points):
+    return [{"t": t, "v": v} for t, v in points]
+
+
+def _parse_since(raw: str):
+    """since=<мс> (один курсор на все ряды) или since=<id>:<мс>,<id>:<мс> (свой у каждого)."""
+    if not raw:
+        return None
+    if ":" not in raw:
+        return int(raw)
+    since = {}
+    for pair in raw.split(","):
+        sid, _, ms = pair.partition(":")
+        since[int(sid)] = int(ms)
+    return since
+
+
+def _series_params(request):
+    """
+    Параметры рядов из GET: range, курсор since (см. _parse_since), points и agg.
+    Ответ всегда не длиннее SERIES_MAX_POINTS точек на сенсор:
+    окно агрегации считается из range и points. ValueError на мусор.
+    """
     rng = request.GET.get("range", "24h")
-    from django.conf import settings
-    flux = f'''
-from(bucket: "{settings.INFLUX_BUCKET}")
-  |> range(start: -{rng})
-  |> filter(fn: (r) => r["_measurement"] == "{influx.MEASUREMENT}")
-  |> filter(fn: (r) => r["sensor_id"] == "{sensor_id}")
-  |> filter(fn: (r) => r["_field"] == "value")
-  |> keep(columns: ["_time","_value"])
-  |> sort(columns: ["_time"])
-'''
-    tables = influx._query.query(flux, org=settings.INFLUX_ORG)
-    series = []
-    for tbl in tables:
-        for rec in tbl.records:
-            ts_ms = int(rec.get_time().timestamp() * 1000)
-            series.append({"t": ts_ms, "v": rec.get_value()})
-    return JsonResponse({"series": series})
+    points = min(int(request.GET.get("points") or settings.SERIES_MAX_POINTS),
+                 settings.SERIES_MAX_POINTS)
+    return {
+        "rng": rng,
+        "since_ms": _parse_since(request.GET.get("since", "")),
+        "every_ms": influx.window_every(rng, points),
+        "fn": request.GET.get("agg", "mean"),
+    }
+
+
+def _series_cursor(sensor_id, last, params):
+    """
+    Курсор ряда для следующего опроса — время самой свежей отданной точки
+    (last, мс; None — новых точек нет, курсор остаётся прежним).
+    При агрегации последнее окно ещё дописывается, поэтому курсор ставится
+    перед его началом: окно придёт заново целиком, клиент заменит точку.
+    Курсор у каждого ряда свой: точки одного датчика могут приходить позже
+    самых свежих точек другого (пачки воркеров, устройства со своим t).
+    """
+    if last is None:
+        since = params["since_ms"]
+        return since.get(sensor_id) if isinstance(since, dict) else since
+    return last - 1 if params["every_ms"] else last
+
+
+SERIES_FORMATS = ("json", "columnar", "binary")
+
+
+def _series_format(request) -> str:
+    """?format=json|columnar|binary, без него — binary по Accept: application/octet-stream."""
+    fmt = request.GET.get("format")
+    if fmt is None:
+        fmt = "binary" if "application/octet-stream" in request.headers.get("Accept", "") else "json"
+    if fmt not in SERIES_FORMATS:
+        raise ValueError(f"bad format: {fmt!r}")
+    return fmt
+
+
+def _read_series(ids, params, fmt):
+    if fmt == "json":
+        return influx.read_series(ids, **params)
+    return influx.read_series_arrays(ids, **params)
+
+
+_EMPTY = np.empty(0)
+
+
+@metrics.timed("serialize")
+def _series_packed(series, ids, params, fmt, single=False):
+    """
+    Ответ из массивов read_series_arrays.
+    columnar: {"t": [t0, Δ1, Δ2, ...], "v": [...]} — метки (мс) дельтами
+    от предыдущей, первая — как есть.
+    binary: подряд Float64 little-endian — число рядов, затем по каждому
+    sensor_id, n, курсор ряда (NaN — нет), n меток (мс), n значений.
+    """
+    cursors = {sid: _series_cursor(sid, int(series[sid][0][-1]) if sid in series else None, params)
+               for sid in ids}
+    if fmt == "binary":
+        parts = [np.array([len(ids)], dtype="<f8")]
+        for sid in ids:
+            ts, values = series.get(sid, (_EMPTY, _EMPTY))
+            cursor = np.nan if cursors[sid] is None else cursors[sid]
+            parts += [np.array([sid, len(ts), cursor], dtype="<f8"), ts.astype("<f8"), values.astype("<f8")]
+        return HttpResponse(np.concatenate(parts).tobytes(), content_type="application/octet-stream")
+
+    def columnar(sid):
+        ts, values = series.get(sid, (_EMPTY, _EMPTY))
+        return {"t": np.diff(ts, prepend=0).astype(np.int64).tolist(), "v": values.tolist()}
+
+    if single:
+        return JsonResponse({"series": columnar(ids[0]), "cursor": cursors[ids[0]]})
+    return JsonResponse({
+        "series": {str(sid): columnar(sid) for sid in ids},
+        "cursor": {str(sid): cursor for sid, cursor in cursors.items()},
+    })
+
+
+@require_GET
+def api_sensor_series(request, sensor_id: int):
+    """
+    Ряд одного сенсора: ?range=24h[&since=<мс>][&points=][&agg=][&format=],
+    cursor — число.
+    format=json (по умолчанию) — [{"t", "v"}, ...], columnar и binary — см.
+    _series_packed.
+    """
+    try:
+        params = _series_params(request)
+        fmt = _series_format(request)
+        series = _read_series([sensor_id], params, fmt)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if fmt != "json":
+        return _series_packed(series, [sensor_id], params, fmt, single=True)
+    points = series.get(sensor_id, [])
+    with metrics.timed("serialize"):
+        return JsonResponse({
+            "series": _series_json(points),
+            "cursor": _series_cursor(sensor_id, points[-1][0] if points else None, params),
+        })
+
+
+@require_GET
+def api_sensors_series(request):
+    """
+    Ряды сразу для набора сенсоров:
+    ?ids=1,2,3&range=30m[&since=<id>:<мс>,...][&points=200][&agg=mean|min|max|last][&format=].
+    Один Flux-запрос вместо запроса на каждую плитку панели; cursor —
+    {"<id>": мс} по рядам, их и передавать в since следующего опроса.
+    """
+    try:
+        params = _series_params(request)
+        fmt = _series_format(request)
+        ids = [int(i) for i in request.GET.get("ids", "").split(",") if i.strip()]
+        series = _read_series(ids, params, fmt)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if fmt != "json":
+        return _series_packed(series, ids, params, fmt)
+    with metrics.timed("serialize"):
+        return JsonResponse({
+            "series": {str(sid): _series_json(series.get(sid, [])) for sid in ids},
+            "cursor": {str(sid): _series_cursor(sid, series[sid][-1][0] if series.get(sid) else None, params)
+                       for sid in ids},
+        })
+
+
+async def api_live(request):
+    """
+    Живые значения и новые Alert через Server-Sent Events (см. core.live),
+    ?ids=1,2,3 — только эти датчики. Держит соединение, поэтому только под
+    ASGI (uvicorn dacha.asgi:application); под WSGI — 501, страницы тогда
+    опрашивают API сами (и по HEAD узнают, что переподключаться незачем).
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error": "живые обновления работают только под ASGI"}, status=501)
+    if request.method != "GET":
+        return JsonResponse({"error": "GET"}, status=405)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"error": "нужен вход"}, status=401)
+    try:
+        ids = [int(i) for i in request.GET.get("ids", "").split(",") if i.strip()]
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return StreamingHttpResponse(
+        live.stream(ids),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _ingest_authorized(request) -> bool:
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and any(
+        hmac.compare_digest(token.encode(), t.encode()) for t in settings.INGEST_TOKENS
+    )
+
+
+@csrf_exempt
+@require_POST
+def api_ingest(request):
+    """
+    Приём показаний от устройств (см. core.ingest), Authorization: Bearer
+    <один из INGEST_TOKENS>. application/json — массив {"id", "t", "v"},
+    text/plain — line protocol (?precision=ns|us|ms|s). Ответ 202
+    {"accepted": N, "rejected": [{"index", "error"}, ...]} — запись в
+    InfluxDB идёт пакетно уже после ответа.
+    """
+    if not _ingest_authorized(request):
+        return JsonResponse({"error": "нужен токен приёма показаний"}, status=401)
+    try:
+        if request.content_type == "application/json":
+            readings, t_scale = ingest.parse_json(request.body), 1_000_000
+        elif request.content_type == "text/plain":
+            readings = ingest.parse_line_protocol(request.body.decode(request.encoding or "utf-8"),
+                                                  request.GET.get("precision", "ns"))
+            t_scale = 1
+        else:
+            return JsonResponse({"error": "application/json или text/plain"}, status=415)
+    except (ingest.IngestError, UnicodeDecodeError) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if len(readings) > settings.INGEST_MAX_READINGS:
+        return JsonResponse({"error": f"не больше {settings.INGEST_MAX_READINGS} показаний"}, status=413)
+
+    accepted, rejected = ingest.ingest(readings, t_scale)
+    return JsonResponse({"accepted": accepted, "rejected": rejected[:100], "rejected_total": len(rejected)},
+                        status=202 if accepted or not rejected else 400)
@@ -0,0 +1,27 @@
+// Ряды в формате ?format=binary (portal: api_sensor_series, api_sensors_series):
+// Float64 little-endian подряд — число рядов, затем по каждому sensor_id, n,
+// курсор ряда (NaN — нет), n меток (мс), n значений. Читается напрямую через
+// Float64Array.
+
+// {series: {sensor_id: [{x, y}, ...]}, cursors: {sensor_id: мс | null}}
+async function fetchSeriesBinary(url){
+  const resp = await fetch(url, { headers: { 'Accept': 'application/octet-stream' } });
+  if (!resp.ok) throw new Error(resp.status + ' ' + (await resp.text()));
+  return decodeSeries(await resp.arrayBuffer());
+}
+
+function decodeSeries(buf){
+  const a = new Float64Array(buf);
+  const series = {}, cursors = {};
+  let i = 1;
+  for (let k = 0; k < a[0]; k++) {
+    const id = a[i], n = a[i + 1], cursor = a[i + 2];
+    const ts = a.subarray(i + 3, i + 3 + n), vs = a.subarray(i + 3 + n, i + 3 + 2 * n);
+    const pts = new Array(n);
+    for (let j = 0; j < n; j++) pts[j] = { x: ts[j], y: vs[j] };
+    series[id] = pts;
+    cursors[id] = Number.isNaN(cursor) ? null : cursor;
+    i += 3 + 2 * n;
+  }
+  return { series, cursors };
+}